@@ -0,0 +1,76 @@
+"""
+Scaling benchmark for ipfinder.remove_subnets.
+
+Run from the repository root:
+    python benchmarks/bench_aggregate.py [--sizes 1000,10000,100000,1000000]
+"""
+import argparse
+import ipaddress
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from ipfinder import remove_subnets  # noqa: E402
+
+
+def synthetic_prefixes(count, seed=1):
+    """Builds a country-like prefix set: /16-/24 blocks with nested more-specifics."""
+    rng = random.Random(seed)
+    prefixes = set()
+    while len(prefixes) < count:
+        plen = rng.randint(16, 24)
+        start = rng.getrandbits(32) >> (32 - plen) << (32 - plen)
+        prefixes.add(ipaddress.IPv4Network((start, plen)))
+        for _ in range(rng.randint(0, 3)):
+            sub_len = rng.randint(plen + 1, 28)
+            offset = rng.getrandbits(sub_len - plen) << (32 - sub_len)
+            prefixes.add(ipaddress.IPv4Network((start + offset, sub_len)))
+    return list(prefixes)[:count]
+
+
+def legacy_remove_subnets(prefixes):
+    """The original O(n^2) implementation, kept for comparison."""
+    cleaned = []
+    for net in sorted(prefixes, key=lambda x: x.prefixlen):
+        if not any(net.subnet_of(bigger) for bigger in cleaned):
+            cleaned.append(net)
+    return cleaned
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument(
+        "--legacy-limit",
+        type=int,
+        default=10000,
+        help="largest size to also time with the quadratic implementation",
+    )
+    args = parser.parse_args()
+
+    print(f"{'prefixes':>10} {'sweep':>10} {'collapse':>10} {'legacy':>10} {'kept':>10}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        prefixes = synthetic_prefixes(size)
+        sweep_time, kept = timed(remove_subnets, prefixes)
+        collapse_time, _ = timed(remove_subnets, prefixes, collapse=True)
+        legacy = "-"
+        if size <= args.legacy_limit:
+            legacy_time, legacy_kept = timed(legacy_remove_subnets, prefixes)
+            assert set(legacy_kept) == set(kept), "sweep result differs from legacy"
+            legacy = f"{legacy_time:.3f}s"
+        print(
+            f"{size:>10} {sweep_time:>9.3f}s {collapse_time:>9.3f}s {legacy:>10} {len(kept):>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
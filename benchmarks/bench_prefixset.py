@@ -0,0 +1,114 @@
+"""
+Memory and speed benchmark for PrefixSet against a set of IPv4Network objects.
+
+Run from the repository root:
+    python benchmarks/bench_prefixset.py [--size 2000000] [--legacy-size 500000] [--ipv6-size 1000000]
+"""
+import argparse
+import ipaddress
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from ipfinder import remove_subnets  # noqa: E402
+from prefixset import PrefixSet, pack, unpack  # noqa: E402
+
+
+def synthetic_pairs(count, seed=1, bits=32, lengths=(12, 28)):
+    """Yields (network, prefixlen) pairs with nesting and roughly 10% duplicates."""
+    rng = random.Random(seed)
+    produced = []
+    for _ in range(count):
+        if produced and rng.random() < 0.1:
+            yield rng.choice(produced)
+            continue
+        plen = rng.randint(*lengths)
+        pair = (rng.getrandbits(bits) >> (bits - plen) << (bits - plen), plen)
+        if len(produced) < 10000:
+            produced.append(pair)
+        yield pair
+
+
+def build_prefix_set(pairs):
+    prefix_set = PrefixSet(pairs)
+    prefix_set.keys()
+    return prefix_set
+
+
+def measure(label, build):
+    """Times build() untraced, then runs it again under tracemalloc for its memory use."""
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"  {label:<28} {elapsed:>8.2f}s  held {current / 2**20:>8.1f} MiB  peak {peak / 2**20:>8.1f} MiB"
+    )
+    return result
+
+
+def run(size, legacy):
+    print(f"{size} prefixes")
+    pairs = list(synthetic_pairs(size))
+    prefix_set = measure("PrefixSet build + dedup", lambda: build_prefix_set(pairs))
+    measure("PrefixSet aggregate", lambda: prefix_set.aggregated())
+    probe = [ipaddress.IPv4Network(unpack(k)) for k in prefix_set.keys()[:: max(1, size // 10000)]]
+    start = time.perf_counter()
+    assert all(p in prefix_set for p in probe)
+    print(f"  {'PrefixSet membership':<28} {(time.perf_counter() - start) / len(probe) * 1e6:>8.2f}us per lookup")
+    text = measure("PrefixSet to_text", prefix_set.to_text)
+    measure("PrefixSet from_text", lambda: PrefixSet.from_text(text.splitlines()).keys())
+    if legacy:
+        networks = measure(
+            "set(IPv4Network) build", lambda: {ipaddress.IPv4Network(p) for p in pairs}
+        )
+        measure("set(IPv4Network) aggregate", lambda: remove_subnets(networks))
+
+
+def run_ipv6(size):
+    print(f"{size} IPv6 prefixes")
+    # Everything is drawn from 2a00::/20 so that nesting and sibling merges actually happen.
+    keys = [
+        pack(0x2A00 << 112 | network, plen + 20)
+        for network, plen in synthetic_pairs(size, bits=108, lengths=(12, 44))
+    ]
+    prefix_set = measure("PrefixSet build + dedup", lambda: build_ipv6_set(keys))
+    measure("PrefixSet aggregate", lambda: prefix_set.aggregated())
+    measure("PrefixSet collapse", lambda: prefix_set.aggregated(collapse=True))
+    text = prefix_set.to_text().splitlines()[:100000]
+    measure(f"PrefixSet parse {len(text)}", lambda: PrefixSet.from_text(text).keys(6))
+
+
+def build_ipv6_set(keys):
+    prefix_set = PrefixSet.from_keys(keys, 6)
+    prefix_set.keys(6)
+    return prefix_set
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=2000000)
+    parser.add_argument(
+        "--legacy-size",
+        type=int,
+        default=500000,
+        help="size at which to also measure a plain set of IPv4Network objects (0 to skip)",
+    )
+    parser.add_argument("--ipv6-size", type=int, default=1000000, help="IPv6 prefixes to measure (0 to skip)")
+    args = parser.parse_args()
+    if args.legacy_size:
+        run(args.legacy_size, legacy=True)
+    run(args.size, legacy=False)
+    if args.ipv6_size:
+        run_ipv6(args.ipv6_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Checks the bulk dataset readers against the small sample files in benchmarks/samples:
+a pfx2as dump (also read gzip-compressed), an MRT TABLE_DUMP_V2 RIB dump and an
+extended RIR delegated-stats file.
+
+Run from the repository root:
+    python benchmarks/check_ingest.py
+
+The exit code is 1 when any reader's output differs from the expected prefixes.
+"""
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLES_DIR = os.path.join(BENCH_DIR, "samples")
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+
+from bulk import ingest, open_dataset, read_delegated  # noqa: E402
+
+# --- Expected Results ---
+# Per-ASN prefixes as CIDR strings in PrefixSet order, IPv4 first.
+EXPECTED_PFX2AS = {
+    "12880": ["2.176.0.0/12", "5.1.2.0/24", "5.160.0.0/16"],
+    "58224": ["2.176.0.0/12", "185.20.160.0/22"],
+    "16322": ["91.98.0.0/15"],
+    "31549": ["91.98.0.0/15"],
+    "64512": ["10.0.0.0/8"],
+    "48434": ["2a01:5ec0::/29"],
+}
+EXPECTED_MRT = {
+    "12880": ["5.160.0.0/16"],
+    "58224": ["185.20.160.0/22"],
+    "49666": ["185.20.160.0/22"],
+    "16322": ["91.98.0.0/15"],
+    "31549": ["91.98.0.0/15"],
+    "48434": ["2a01:5ec0::/29"],
+}
+EXPECTED_DELEGATED_ASNS = ["12880", "58224", "58225"]
+EXPECTED_DELEGATED = {
+    "12880": ["5.160.0.0/16", "2a01:5ec0::/29"],
+    "58224": ["185.20.160.0/23", "185.20.162.0/24"],
+    "58225": ["185.20.160.0/23", "185.20.162.0/24"],
+}
+
+
+def sample(name):
+    return os.path.join(SAMPLES_DIR, name)
+
+
+def as_strings(asn_prefixes):
+    return {asn: prefixes.to_text().splitlines() for asn, prefixes in asn_prefixes.items()}
+
+
+def read_delegated_sample(path, countries):
+    with open_dataset(path) as f:
+        asns, asn_prefixes = read_delegated(f, countries)
+    return asns, as_strings(asn_prefixes)
+
+
+# --- Checks ---
+def run_checks(scratch):
+    """Returns [(name, expected, actual)] for every sample read."""
+    compressed = os.path.join(scratch, "pfx2as.txt.gz")
+    with open(sample("pfx2as.txt"), "rb") as src, gzip.open(compressed, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    asns, delegated = read_delegated_sample(sample("delegated-extended.txt"), ["IR"])
+    return [
+        ("pfx2as", EXPECTED_PFX2AS, as_strings(ingest(pfx2as=[sample("pfx2as.txt")]))),
+        ("pfx2as (gzip)", EXPECTED_PFX2AS, as_strings(ingest(pfx2as=[compressed]))),
+        ("pfx2as --asn", {"12880": EXPECTED_PFX2AS["12880"]},
+         as_strings(ingest(pfx2as=[sample("pfx2as.txt")], asns=["12880"]))),
+        ("mrt", EXPECTED_MRT, as_strings(ingest(mrt=[sample("rib.mrt")]))),
+        ("delegated asns", EXPECTED_DELEGATED_ASNS, asns),
+        ("delegated prefixes", EXPECTED_DELEGATED, delegated),
+    ]
+
+
+def main():
+    scratch = tempfile.mkdtemp()
+    try:
+        results = run_checks(scratch)
+    finally:
+        shutil.rmtree(scratch)
+    failed = 0
+    for name, expected, actual in results:
+        if expected == actual:
+            print(f"ok      {name}")
+            continue
+        failed += 1
+        print(f"FAILED  {name}\n  expected: {expected}\n  actual:   {actual}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
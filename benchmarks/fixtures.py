@@ -0,0 +1,164 @@
+"""
+Deterministic synthetic fixtures shaped like BGPView data: country report pages,
+prefix API payloads and nested prefix sets of any size.
+
+Write a set of fixture files to a directory:
+    python benchmarks/fixtures.py --out benchmarks/data [--size 1000000]
+"""
+import argparse
+import ipaddress
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from prefixset import PrefixSet, pack  # noqa: E402
+
+ROWS_PER_PAGE = 100
+COUNTRY_BASES = {"IR": 12000, "AE": 5000, "TR": 8000, "DE": 3000}
+
+
+def page_asns(country, page, rows=ROWS_PER_PAGE):
+    """The ASNs listed on one report page; every country gets its own disjoint range."""
+    base = COUNTRY_BASES.get(country, 40000) * 10 + (page - 1) * rows
+    return [base + i for i in range(rows)]
+
+
+def report_page_html(country, page, last_page, rows=ROWS_PER_PAGE, seed=1):
+    """
+    Renders a country report page like bgpview.io: site chrome, the table#country-report
+    with several cells per row and a sliding window of pagination links.
+    Pages past last_page have an empty table body.
+    """
+    rng = random.Random(f"{seed}-{country}-{page}")
+    body = []
+    if page <= last_page:
+        for asn in page_asns(country, page, rows):
+            body.append(
+                f'<tr><td><a href="/asn/{asn}">AS{asn}</a></td>'
+                f"<td>Network Operator {rng.randint(1, 99999)} Ltd.</td>"
+                f'<td><img src="/img/flags/{country.lower()}.png"> {country}</td>'
+                f"<td>{rng.randint(1, 4000)}</td><td>{rng.randint(0, 40)}</td>"
+                f"<td>{rng.randint(1, 200)}</td></tr>\n"
+            )
+    links = "".join(
+        f'<li><a href="/reports/countries/{country}?page={p}">{p}</a></li>'
+        for p in range(max(1, page - 3), min(last_page, page + 3) + 1)
+    )
+    chrome = "<div class='navbar'>" + "<a href='/'>Home</a>" * 40 + "</div>\n"
+    return (
+        "<!DOCTYPE html><html><head><title>Country Report</title>"
+        + "<script>var x = 1;</script>" * 20
+        + "</head><body>\n"
+        + chrome
+        + "<table id='country-report' class='table'><thead><tr><th>ASN</th><th>Name</th>"
+        + "<th>Country</th><th>IPv4</th><th>IPv6</th><th>Peers</th></tr></thead><tbody>\n"
+        + "".join(body)
+        + "</tbody></table>\n"
+        + f"<ul class='pagination'>{links}</ul>\n"
+        + "<footer>" + "<p>footer text</p>" * 200 + "</footer></body></html>"
+    )
+
+
+def prefix_payload(asn, ipv4=60, ipv6=10, seed=1):
+    """Renders a prefix API response for an ASN, including the nested 'parent' objects BGPView sends."""
+    rng = random.Random(f"{seed}-{asn}")
+
+    def item(network):
+        return {
+            "prefix": str(network),
+            "ip": str(network.network_address),
+            "cidr": network.prefixlen,
+            "roa_status": rng.choice(["Valid", "None"]),
+            "name": f"NET-{asn}",
+            "description": f"Operator {asn} customer block",
+            "country_code": "IR",
+            "parent": {
+                "prefix": str(network.supernet(new_prefix=max(8, network.prefixlen - 4))),
+                "ip": None,
+                "cidr": None,
+                "rir_name": "RIPE",
+                "allocation_status": "allocated",
+            },
+        }
+
+    v4 = [
+        ipaddress.IPv4Network((rng.getrandbits(32) >> 8 << 8, 24)).supernet(
+            new_prefix=rng.randint(16, 24)
+        )
+        for _ in range(ipv4)
+    ]
+    v6 = [
+        ipaddress.IPv6Network((0x2A00 << 112 | rng.getrandbits(100) << 16, 112)).supernet(
+            new_prefix=rng.randint(29, 48)
+        )
+        for _ in range(ipv6)
+    ]
+    return json.dumps(
+        {
+            "status": "ok",
+            "status_message": "Query was successful",
+            "data": {
+                "ipv4_prefixes": [item(n) for n in v4],
+                "ipv6_prefixes": [item(n) for n in v6],
+            },
+            "@meta": {"time_zone": "UTC", "api_version": 1},
+        }
+    )
+
+
+def nested_pairs(count, seed=1):
+    """
+    Yields (network, prefixlen) IPv4 pairs shaped like a routing table: covering
+    allocations between /12 and /20, each de-aggregated into a few more-specifics
+    down to /24, with about 5% duplicate announcements.
+    """
+    rng = random.Random(seed)
+    produced = 0
+    recent = []
+    while produced < count:
+        plen = rng.randint(12, 20)
+        network = rng.getrandbits(32) >> (32 - plen) << (32 - plen)
+        yield network, plen
+        produced += 1
+        for _ in range(min(rng.randint(0, 6), count - produced)):
+            if recent and rng.random() < 0.05:
+                yield rng.choice(recent)
+            else:
+                sub_len = rng.randint(plen + 1, 24)
+                offset = rng.getrandbits(sub_len - plen) << (32 - sub_len)
+                pair = (network + offset, sub_len)
+                if len(recent) < 4096:
+                    recent.append(pair)
+                yield pair
+            produced += 1
+
+
+def nested_prefix_set(count, seed=1):
+    """Builds a PrefixSet of count nested prefixes straight from packed keys."""
+    return PrefixSet.from_keys(pack(network, plen) for network, plen in nested_pairs(count, seed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--out", required=True, help="directory to write the fixtures to")
+    parser.add_argument("--size", type=int, default=100000, help="prefixes in the prefix list fixture")
+    parser.add_argument("--pages", type=int, default=5, help="report pages to write")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for page in range(1, args.pages + 1):
+        with open(os.path.join(args.out, f"report-IR-{page}.html"), "w") as f:
+            f.write(report_page_html("IR", page, args.pages))
+    for asn in page_asns("IR", 1)[:10]:
+        with open(os.path.join(args.out, f"prefixes-{asn}.json"), "w") as f:
+            f.write(prefix_payload(asn))
+    with open(os.path.join(args.out, f"prefixes-{args.size}.txt"), "w") as f:
+        f.write(nested_prefix_set(args.size).to_text())
+    print(f"Fixtures written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Local stand-in for bgpview.io and its prefix API with configurable latency and throttling.
+
+Run it on its own and point the tools at it:
+    python benchmarks/mock_server.py --port 8080 --latency 0.05 --rate-limit 20 --throttle 0.01
+    python src/asnfinder.py --report-url "http://127.0.0.1:8080/reports/countries/{country}?page={page}"
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import ROWS_PER_PAGE, prefix_payload, report_page_html  # noqa: E402
+
+REPORT_PATH = re.compile(r"^/reports/countries/([A-Za-z]{2})$")
+PREFIX_PATH = re.compile(r"^/asn/(\d+)/prefixes$")
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per response.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        with server.lock:
+            server.stats["requests"] += 1
+            throttled = not server.take_token() or server.rng.random() < server.throttle
+            if throttled:
+                server.stats["throttled"] += 1
+        if throttled:
+            self.respond(429, b"Too Many Requests", {"Retry-After": str(server.retry_after)})
+            return
+
+        url = urlparse(self.path)
+        report = REPORT_PATH.match(url.path)
+        prefixes = PREFIX_PATH.match(url.path)
+        if report:
+            country = report.group(1).upper()
+            page = int(parse_qs(url.query).get("page", ["1"])[0])
+            body = server.page(country, page)
+        elif prefixes:
+            body = server.payload(int(prefixes.group(1)))
+        else:
+            self.respond(404, b"Not Found")
+            return
+        self.respond(200, body, {"Content-Type": "text/html; charset=utf-8"})
+
+    def respond(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockBGPView(ThreadingHTTPServer):
+    """
+    Serves generated report pages and prefix payloads on a local port.
+    Every request waits `latency` seconds. Requests beyond `rate_limit` per second, plus
+    a random `throttle` fraction of the rest, are answered with HTTP 429 and a Retry-After
+    of `retry_after` seconds. Generated bodies are memoised so the server itself does not
+    dominate what is being measured.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port=0,
+        latency=0.0,
+        throttle=0.0,
+        retry_after=0,
+        pages=None,
+        rows=ROWS_PER_PAGE,
+        seed=1,
+        rate_limit=None,
+    ):
+        super().__init__(("127.0.0.1", port), MockHandler)
+        self.latency = latency
+        self.throttle = throttle
+        self.rate_limit = rate_limit
+        self._tokens = rate_limit or 0
+        self._stamp = time.monotonic()
+        self.retry_after = retry_after
+        self.pages = pages or {"IR": 10}
+        self.rows = rows
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0}
+        self._bodies = {}
+        self._thread = None
+
+    def take_token(self):
+        """Token bucket for rate_limit; call with the lock held."""
+        if not self.rate_limit:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.rate_limit, self._tokens + (now - self._stamp) * self.rate_limit)
+        self._stamp = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def page(self, country, page):
+        key = ("page", country, page)
+        if key not in self._bodies:
+            last_page = self.pages.get(country, 0)
+            self._bodies[key] = report_page_html(country, page, last_page, self.rows, self.seed).encode()
+        return self._bodies[key]
+
+    def payload(self, asn):
+        key = ("asn", asn)
+        if key not in self._bodies:
+            self._bodies[key] = prefix_payload(asn, seed=self.seed).encode()
+        return self._bodies[key]
+
+    def warm(self, countries=(), pages=0, asns=()):
+        """Generates bodies ahead of time, so a benchmark's timed part only sees serving costs."""
+        for country in countries:
+            for page in range(1, pages + 2):
+                self.page(country, page)
+        for asn in asns:
+            self.payload(asn)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def report_url(self):
+        return self.base_url + "/reports/countries/{country}?page={page}"
+
+    @property
+    def api_url(self):
+        return self.base_url + "/asn/{asn}/prefixes"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--throttle", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--rate-limit", type=float, help="requests per second before answering 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with each 429")
+    parser.add_argument("--pages", type=int, default=10, help="report pages per country")
+    args = parser.parse_args()
+
+    server = MockBGPView(
+        args.port,
+        args.latency,
+        args.throttle,
+        args.retry_after,
+        {country: args.pages for country in ("IR", "AE", "TR", "DE")},
+        rate_limit=args.rate_limit,
+    )
+    print(f"Serving on {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
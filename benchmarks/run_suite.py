@@ -0,0 +1,282 @@
+"""
+Stage-by-stage benchmark suite: HTML and JSON parsing, prefix aggregation and
+fetching against a local mock server with latency and 429s.
+
+Run from the repository root, save the results, and compare a later run against them:
+    python benchmarks/run_suite.py --save baseline.json
+    python benchmarks/run_suite.py --baseline baseline.json [--tolerance 0.2]
+
+The exit code is 1 when any stage got slower or used more memory than the tolerance allows.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+sys.path.insert(0, BENCH_DIR)
+
+from asnfinder import extract_asns, scan_countries  # noqa: E402
+from fixtures import ROWS_PER_PAGE, nested_prefix_set, page_asns, prefix_payload, report_page_html  # noqa: E402
+from httpclient import RequestScheduler  # noqa: E402
+from ipfinder import fetch_prefixes_concurrently, parse_prefix_payload, remove_subnets  # noqa: E402
+from mock_server import MockBGPView  # noqa: E402
+from parallel import aggregate_prefixes, default_processes, parse_prefix_text  # noqa: E402
+from pipeline import run_pipeline  # noqa: E402
+
+DEFAULT_SIZES = "10000,100000,1000000"
+
+
+# --- Measurement ---
+def measure(run, memory=True):
+    """
+    Times run() untraced, then runs it again under tracemalloc for its peak memory.
+    run() returns the number of items it processed.
+    """
+    start = time.perf_counter()
+    items = run()
+    elapsed = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        "items": items,
+        "seconds": round(elapsed, 4),
+        "throughput": round(items / elapsed, 1) if elapsed else None,
+        "peak_mib": None if peak is None else round(peak / 2**20, 2),
+    }
+
+
+def client_scheduler():
+    """A fresh client rate limiter that starts fast enough to hit the mock server's limit."""
+    return RequestScheduler(rate=100, max_rate=400)
+
+
+def quietly(func, *args, **kwargs):
+    """Runs func with the tools' progress lines sent to devnull."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return func(*args, **kwargs)
+
+
+# --- Stages ---
+def html_stage(pages):
+    bodies = [report_page_html("IR", page, pages) for page in range(1, pages + 1)]
+
+    def run():
+        return sum(len(extract_asns([body])) for body in bodies)
+
+    return run
+
+
+def json_stage(asns, ipv4=60, ipv6=10):
+    bodies = [prefix_payload(asn, ipv4, ipv6) for asn in range(1, asns + 1)]
+
+    def run():
+        return sum(len(parse_prefix_payload(body)) for body in bodies)
+
+    return run
+
+
+def aggregate_stage(size, collapse):
+    prefixes = nested_prefix_set(size)
+    prefixes.keys()
+
+    def run():
+        remove_subnets(prefixes, collapse=collapse)
+        return size
+
+    return run
+
+
+def parallel_aggregate_stage(size, collapse, processes):
+    prefixes = nested_prefix_set(size)
+    prefixes.keys()
+
+    def run():
+        aggregate_prefixes(prefixes, collapse, processes)
+        return size
+
+    return run
+
+
+def parallel_parse_stage(size, processes):
+    text = nested_prefix_set(size).to_text()
+
+    def run():
+        parse_prefix_text(text, processes)
+        return size
+
+    return run
+
+
+def build_stage(size):
+    def run():
+        nested_prefix_set(size).keys()
+        return size
+
+    return run
+
+
+def fetch_pages_stage(server, pages, workers):
+    server.warm(["IR"], pages)
+
+    def run():
+        results = quietly(
+            scan_countries, ["IR"], None, workers, server.report_url, None, client_scheduler()
+        )
+        asns, failed = results["IR"]
+        assert not failed and len(asns) == pages * len(page_asns("IR", 1)), "page scan lost data"
+        return pages
+
+    return run
+
+
+def fetch_prefixes_stage(server, asns, workers):
+    server.warm(asns=range(1, asns + 1))
+
+    def run():
+        fetched = quietly(
+            list,
+            fetch_prefixes_concurrently(
+                range(1, asns + 1), workers, server.api_url, None, client_scheduler()
+            ),
+        )
+        assert all(prefixes is not None for _, prefixes in fetched), "prefix fetch lost data"
+        return asns
+
+    return run
+
+
+def pipeline_stage(server, asns, workers):
+    """Scrapes just enough pages to feed about `asns` ASNs through the pipeline."""
+    pages = range(1, max(1, asns // ROWS_PER_PAGE) + 1)
+    server.warm(["IR"], len(pages), [asn for page in pages for asn in page_asns("IR", page)])
+
+    def run():
+        _, asns, failed_pages, failed_asns = quietly(
+            run_pipeline,
+            pages,
+            ["IR"],
+            4,
+            workers,
+            report_url=server.report_url,
+            api_url=server.api_url,
+            page_scheduler=client_scheduler(),
+            api_scheduler=client_scheduler(),
+        )
+        assert not failed_pages and not failed_asns, "pipeline lost data"
+        return len(asns)
+
+    return run
+
+
+def build_stages(args, server):
+    """Returns (name, unit, make_run) triples; make_run builds fixtures outside the timed part."""
+    stages = [
+        ("html_parse", "rows", lambda: html_stage(args.pages)),
+        ("json_parse", "prefixes", lambda: json_stage(args.asns)),
+        ("json_parse_large", "prefixes", lambda: json_stage(max(1, args.asns // 100), 5000, 500)),
+    ]
+    for size in (int(s) for s in args.sizes.split(",")):
+        stages.append((f"prefixset_build_{size}", "prefixes", lambda size=size: build_stage(size)))
+        stages.append((f"aggregate_{size}", "prefixes", lambda size=size: aggregate_stage(size, False)))
+        stages.append((f"collapse_{size}", "prefixes", lambda size=size: aggregate_stage(size, True)))
+        stages.append(
+            (f"parallel_parse_{size}", "prefixes", lambda size=size: parallel_parse_stage(size, args.processes))
+        )
+        stages.append(
+            (
+                f"parallel_collapse_{size}",
+                "prefixes",
+                lambda size=size: parallel_aggregate_stage(size, True, args.processes),
+            )
+        )
+    stages.extend(
+        [
+            ("fetch_pages", "pages", lambda: fetch_pages_stage(server, args.pages, args.workers)),
+            ("fetch_prefixes", "asns", lambda: fetch_prefixes_stage(server, args.asns, args.workers)),
+            ("pipeline", "asns", lambda: pipeline_stage(server, args.asns, args.workers)),
+        ]
+    )
+    return stages
+
+
+# --- Baseline Comparison ---
+def compare(results, baseline, tolerance):
+    """Returns a list of regression messages for stages present in both runs."""
+    previous = {r["stage"]: r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(result["stage"])
+        if old is None:
+            continue
+        if old["throughput"] and result["throughput"] < old["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{result['stage']}: throughput {result['throughput']:.0f} < {old['throughput']:.0f} {result['unit']}/s"
+            )
+        if old.get("peak_mib") and result["peak_mib"] and result["peak_mib"] > old["peak_mib"] * (1 + tolerance):
+            regressions.append(
+                f"{result['stage']}: peak memory {result['peak_mib']:.1f} > {old['peak_mib']:.1f} MiB"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="prefix set sizes, e.g. 10000,100000,1000000,5000000")
+    parser.add_argument("--pages", type=int, default=20, help="report pages per run")
+    parser.add_argument("--asns", type=int, default=300, help="ASNs per prefix fetch run")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=default_processes(), help="processes for the parallel_* stages")
+    parser.add_argument("--latency", type=float, default=0.02, help="mock server latency in seconds")
+    parser.add_argument("--rate-limit", type=float, default=150, help="mock server requests per second before 429s")
+    parser.add_argument("--throttle", type=float, default=0.01, help="fraction of other mock requests answered with 429")
+    parser.add_argument("--stages", help="comma-separated stage name prefixes to run")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced run that measures peak memory")
+    parser.add_argument("--save", help="write the results as JSON")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown or memory growth")
+    args = parser.parse_args()
+
+    wanted = args.stages.split(",") if args.stages else None
+    results = []
+    with MockBGPView(
+        latency=args.latency, throttle=args.throttle, pages={"IR": args.pages}, rate_limit=args.rate_limit
+    ) as server:
+        print(f"{'stage':<26} {'items':>9} {'seconds':>9} {'throughput':>21} {'peak MiB':>9}")
+        for name, unit, make_run in build_stages(args, server):
+            if wanted and not any(name.startswith(w) for w in wanted):
+                continue
+            result = {"stage": name, "unit": unit}
+            result.update(measure(make_run(), memory=not args.no_memory))
+            results.append(result)
+            peak = "-" if result["peak_mib"] is None else f"{result['peak_mib']:.1f}"
+            print(
+                f"{name:<26} {result['items']:>9} {result['seconds']:>9.3f} "
+                f"{result['throughput']:>10.0f} {unit + '/s':<10} {peak:>9}"
+            )
+        print(f"mock server: {server.stats['requests']} requests, {server.stats['throttled']} throttled")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# --- Integer Range Helpers ---
+def drop_contained(ranges):
+    """Sweeps sorted ranges once, dropping every range covered by an earlier one."""
+    kept = []
+    reach = -1
+    for start, end in ranges:
+        if end > reach:
+            kept.append((start, end))
+            reach = end
+    return kept
+
+
+def merge_adjacent(ranges):
+    """Merges sorted, non-overlapping ranges that touch into single intervals."""
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def range_to_cidrs(start, end, bits=32):
+    """Splits an inclusive integer range into the fewest (network, prefixlen) blocks."""
+    blocks = []
+    while start <= end:
+        align = (start & -start).bit_length() - 1 if start else bits
+        span = (end - start + 1).bit_length() - 1
+        size = min(align, span)
+        blocks.append((start, bits - size))
+        start += 1 << size
+    return blocks
+
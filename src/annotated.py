@@ -0,0 +1,209 @@
+import bisect
+import csv
+from array import array
+from itertools import repeat
+
+from export import atomic_write
+from lookup import parse_ip
+from prefixset import (
+    ADDRESS_BITS,
+    PREFIXLEN_BITS,
+    PREFIXLEN_MASK,
+    PrefixSet,
+    format_ipv4_cidr,
+    format_ipv6_cidr,
+    pack,
+    parse_cidr,
+)
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+
+# --- Table Format ---
+# One row per (prefix, ASN) pair, in two columns per address family: packed prefix keys,
+# sorted like PrefixSet keys, and the announcing ASN. A multi-origin prefix is a run of
+# rows with the same key. Exports use the same rows plus the cleaned range each prefix
+# was merged into, after merging adjacent ranges too when the output was collapsed.
+COLUMNS = ("prefix", "asn", "range")
+BATCH_ROWS = 65536
+
+
+def _end(bits, key):
+    return (key >> PREFIXLEN_BITS) | ((1 << (bits - (key & PREFIXLEN_MASK))) - 1)
+
+
+def _format(version, key):
+    network, prefixlen = key >> PREFIXLEN_BITS, key & PREFIXLEN_MASK
+    if version == 4:
+        return format_ipv4_cidr(network, prefixlen)
+    return format_ipv6_cidr(network, prefixlen)
+
+
+class AnnotatedPrefixes:
+    """
+    Columnar prefix-to-ASN table that keeps which ASNs announced each prefix, at 12 bytes
+    per IPv4 row. A reverse index, the row numbers sorted by ASN, is built on the first
+    by-ASN query. Answers "which ranges does ASN X announce" and "which ASNs announce
+    a range covering IP Y" without the network.
+    """
+
+    def __init__(self, columns):
+        """columns maps 4 and 6 to (keys, asns), sorted by key and then ASN."""
+        self.columns = columns
+        self._lengths = {}
+        self._by_asn = {}
+
+    @classmethod
+    def from_asn_map(cls, asn_prefixes):
+        """Builds the table from {asn: prefixes} with one stable sort of row numbers per family."""
+        sets = sorted(
+            (int(asn), prefixes if isinstance(prefixes, PrefixSet) else PrefixSet(prefixes))
+            for asn, prefixes in asn_prefixes.items()
+        )
+        columns = {}
+        for version in ADDRESS_BITS:
+            keys = array("Q") if version == 4 else []
+            asns = array("I")
+            for asn, prefixes in sets:
+                family_keys = prefixes.keys(version)
+                keys.extend(family_keys)
+                asns.extend(repeat(asn, len(family_keys)))
+            # ASNs were added in order, so the stable sort leaves each key's ASNs sorted.
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            keys = array("Q", map(keys.__getitem__, order)) if version == 4 else [keys[i] for i in order]
+            columns[version] = (keys, array("I", map(asns.__getitem__, order)))
+        return cls(columns)
+
+    def __len__(self):
+        return sum(len(keys) for keys, _ in self.columns.values())
+
+    # --- Queries ---
+    def prefixes_for(self, asn):
+        """Returns the prefixes announced by an ASN as CIDR strings, IPv4 first, in address order."""
+        asn = int(asn)
+        result = []
+        for version, (keys, asns) in self.columns.items():
+            if version not in self._by_asn:
+                order = sorted(range(len(asns)), key=asns.__getitem__)
+                self._by_asn[version] = array("I", map(asns.__getitem__, order)), array("I", order)
+            sorted_asns, rows = self._by_asn[version]
+            first = bisect.bisect_left(sorted_asns, asn)
+            last = bisect.bisect_right(sorted_asns, asn, first)
+            result.extend(_format(version, keys[row]) for row in rows[first:last])
+        return result
+
+    def covering(self, address):
+        """
+        Returns [(prefix, asns)] for every announced prefix containing an address string,
+        most specific first. Costs one binary search per prefix length present in the table.
+        """
+        version, address = parse_ip(address)
+        keys, asns = self.columns[version]
+        bits = ADDRESS_BITS[version]
+        if version not in self._lengths:
+            self._lengths[version] = sorted({key & PREFIXLEN_MASK for key in keys}, reverse=True)
+        result = []
+        for length in self._lengths[version]:
+            candidate = pack(address >> (bits - length) << (bits - length), length)
+            first = bisect.bisect_left(keys, candidate)
+            last = first
+            while last < len(keys) and keys[last] == candidate:
+                last += 1
+            if last > first:
+                result.append((_format(version, candidate), asns[first:last].tolist()))
+        return result
+
+    # --- Export and Import ---
+    def rows(self, collapse=False):
+        """
+        Yields (prefix, asn, range) per row, where range is the cleaned prefix covering it;
+        with collapse=True it is the prefix of the collapsed output covering it instead.
+        """
+        for version, (keys, asns) in self.columns.items():
+            bits = ADDRESS_BITS[version]
+            merged = None
+            if collapse:
+                merged = iter(PrefixSet.from_keys(keys, version).aggregated(True).keys(version))
+            reach, previous, prefix, covering = -1, None, None, None
+            for key, asn in zip(keys, asns):
+                if key != previous:
+                    previous, prefix = key, _format(version, key)
+                    end = _end(bits, key)
+                    if end > reach and merged is None:
+                        reach, covering = end, prefix
+                    elif end > reach:
+                        # Collapsed prefixes are disjoint and sorted, so the first one
+                        # ending at or after this prefix's end contains it.
+                        while end > reach:
+                            merged_key = next(merged)
+                            reach = _end(bits, merged_key)
+                        covering = _format(version, merged_key)
+                yield prefix, asn, covering
+
+    def write(self, path, collapse=False):
+        """Writes Parquet for *.parquet paths, which needs pyarrow, and CSV otherwise, atomically."""
+        if path.endswith(".parquet"):
+            self.write_parquet(path, collapse)
+        else:
+            self.write_csv(path, collapse)
+
+    def write_csv(self, path, collapse=False):
+        with atomic_write(path) as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(COLUMNS)
+            writer.writerows(self.rows(collapse))
+
+    def write_parquet(self, path, collapse=False):
+        """Writes the rows in row groups of BATCH_ROWS, so the export never holds the whole table."""
+        if pyarrow is None:
+            raise ValueError("writing Parquet needs pyarrow: pip install pyarrow")
+        schema = pyarrow.schema(
+            [("prefix", pyarrow.string()), ("asn", pyarrow.uint32()), ("range", pyarrow.string())]
+        )
+        with atomic_write(path, binary=True) as f:
+            with parquet.ParquetWriter(f, schema) as writer:
+                batch = []
+                for row in self.rows(collapse):
+                    batch.append(row)
+                    if len(batch) >= BATCH_ROWS:
+                        writer.write_batch(_record_batch(batch, schema))
+                        batch = []
+                if batch:
+                    writer.write_batch(_record_batch(batch, schema))
+
+    @classmethod
+    def load(cls, path):
+        """Reads a table written by write(); only the prefix and asn columns are needed."""
+        asn_prefixes = {}
+        for prefix, asn in _read_pairs(path):
+            prefixes = asn_prefixes.get(asn)
+            if prefixes is None:
+                prefixes = asn_prefixes[asn] = PrefixSet()
+            version, network, prefixlen = parse_cidr(prefix)
+            prefixes.update_keys([pack(network, prefixlen)], version)
+        return cls.from_asn_map(asn_prefixes)
+
+
+def _record_batch(batch, schema):
+    prefixes, asns, ranges = zip(*batch)
+    return pyarrow.record_batch([list(prefixes), list(asns), list(ranges)], schema=schema)
+
+
+def _read_pairs(path):
+    if path.endswith(".parquet"):
+        if pyarrow is None:
+            raise ValueError("reading Parquet needs pyarrow: pip install pyarrow")
+        for batch in parquet.ParquetFile(path).iter_batches(BATCH_ROWS, columns=["prefix", "asn"]):
+            columns = batch.to_pydict()
+            yield from zip(columns["prefix"], columns["asn"])
+        return
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None or list(header[:2]) != ["prefix", "asn"]:
+            raise ValueError(f"'{path}' is not an annotated prefix table")
+        for row in reader:
+            yield row[0], int(row[1])
@@ -1,7 +1,24 @@
+import argparse
+import contextlib
+import os
+import re
 import requests
-from bs4 import BeautifulSoup
 import time
 import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+
+from cache import CACHE_MODES, DEFAULT_MODE, ResponseCache
+from httpclient import (
+    RequestScheduler,
+    add_scheduler_arguments,
+    create_session,
+    fetch_text,
+    positive_int,
+    scheduler_from_args,
+)
+from journal import add_journal_arguments, journal_from_args
+from metrics import METRICS, add_metrics_arguments, instrumented, record_fetch
 
 # --- ANSI Styles ---
 RESET = "\033[0m"
@@ -29,73 +46,350 @@ SUCCESS_GREEN = "\033[32m"
 
 
 # --- Core Scraping Function (Themed Messages) ---
-def get_asns_from_page(page_number):
+REPORT_URL = "https://bgpview.io/reports/countries/{country}?page={page}"
+DEFAULT_COUNTRY = "IR"
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
+}
+DEFAULT_WORKERS = 8
+# Automatic pagination never goes past this page unless --max-pages says otherwise.
+DEFAULT_MAX_PAGES = 500
+CHUNK_SIZE = 16384
+PAGE_LINK_RE = re.compile(r"""href=["'][^"']*[?&]page=(\d+)""")
+
+
+class CountryReportParser(HTMLParser):
     """
-    This function extracts ASN numbers from a specific page on bgpview.io for Iran.
-    Includes enhanced loading messages with the new theme.
+    Streaming tokenizer for the table#country-report rows.
+    Collects the text of the first cell in each body row and marks itself done after the table closes.
     """
-    url = f"https://bgpview.io/reports/countries/IR?page={page_number}"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
-    }
 
-    sys.stdout.write(
-        f"{WARNING_ORANGE}  [>] Attempting to fetch data from page {page_number}... {RESET}"
-    )
-    sys.stdout.flush()  # Ensure the message is printed immediately
+    def __init__(self):
+        super().__init__()
+        self.cells = []
+        self.done = False
+        self._in_table = False
+        self._in_body = False
+        self._cell_index = 0
+        self._cell = None
+
+    def _close_cell(self):
+        if self._cell is not None:
+            self.cells.append("".join(self._cell).strip())
+            self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == "table" and ("id", "country-report") in attrs:
+            self._in_table = True
+        elif not self._in_table:
+            return
+        elif tag == "tbody":
+            self._in_body = True
+        elif tag == "tr" and self._in_body:
+            self._close_cell()
+            self._cell_index = 0
+        elif tag == "td" and self._in_body:
+            self._close_cell()
+            if self._cell_index == 0:
+                self._cell = []
+            self._cell_index += 1
+
+    def handle_endtag(self, tag):
+        if not self._in_table:
+            return
+        if tag in ("td", "tr"):
+            self._close_cell()
+        elif tag == "tbody":
+            self._close_cell()
+            self._in_body = False
+        elif tag == "table":
+            self._close_cell()
+            self._in_table = False
+            self.done = True
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def extract_asns(chunks):
+    """Parses ASN numbers out of an iterable of HTML text chunks, stopping once the report table ends."""
+    parser = CountryReportParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            break
+    parser.close()
+
+    asn_numbers = []
+    for asn_text in parser.cells:
+        if asn_text.upper().startswith("AS"):
+            number = asn_text.upper().replace("AS", "").strip()
+            if number.isdigit():
+                asn_numbers.append(number)
+    return asn_numbers
+
+
+def last_linked_page(text):
+    """Returns the highest page number among the report's pagination links, or None if it has none."""
+    pages = [int(page) for page in PAGE_LINK_RE.findall(text)]
+    return max(pages) if pages else None
+
+
+def get_asns_from_page(
+    page_number,
+    session=None,
+    report_url=REPORT_URL,
+    cache=None,
+    country=DEFAULT_COUNTRY,
+    scheduler=None,
+):
+    """
+    This function extracts ASN numbers from a specific page on bgpview.io for a country.
+    Pass a shared session to reuse pooled keep-alive connections across pages,
+    a ResponseCache to serve repeated page loads from disk and a RequestScheduler
+    to rate-limit and retry requests.
+    Returns None when the page could not be fetched.
+    """
+    page = fetch_report_page(page_number, session, report_url, cache, country, scheduler)
+    return None if page is None else page[0]
+
+
+def fetch_report_page(
+    page_number,
+    session=None,
+    report_url=REPORT_URL,
+    cache=None,
+    country=DEFAULT_COUNTRY,
+    scheduler=None,
+):
+    """
+    Like get_asns_from_page, but returns (asns, last_linked_page) so callers can tell
+    where the report ends, or None when the page could not be fetched.
+    """
+    url = report_url.format(country=country, page=page_number)
+    status = f"{WARNING_ORANGE}  [>] Attempting to fetch data from {country} page {page_number}... {RESET}"
+    started = time.perf_counter()
+    res = asn_numbers = None
 
     try:
-        res = requests.get(
-            url, headers=headers, timeout=15
-        )  # Increased timeout slightly
-        res.raise_for_status()
-        sys.stdout.write(f"{SUCCESS_GREEN}SUCCESS{RESET}\n")
+        res = fetch_text(session, url, HEADERS, 15, cache, scheduler)
+        if res.status_code != 200:
+            sys.stdout.write(
+                f"{status}{ALERT_RED}HTTP ERROR {res.status_code}{RESET}\n"
+                f"{ALERT_RED}  [!] HTTP Error {res.status_code} for page {page_number}. The page might not exist.{RESET}\n"
+            )
+            return None
+        with METRICS.timed("ipshin_parse_seconds", stage="page"):
+            asn_numbers = extract_asns(
+                res.text[i : i + CHUNK_SIZE] for i in range(0, len(res.text), CHUNK_SIZE)
+            )
     except requests.exceptions.Timeout:
-        sys.stdout.write(f"{ALERT_RED}TIMEOUT{RESET}\n")
-        print(
-            f"{ALERT_RED}  [!] Error: Request timed out for page {page_number}. Network might be slow.{RESET}"
+        sys.stdout.write(
+            f"{status}{ALERT_RED}TIMEOUT{RESET}\n"
+            f"{ALERT_RED}  [!] Error: Request timed out for page {page_number}. Network might be slow.{RESET}\n"
         )
-        return []
+        return None
     except requests.exceptions.ConnectionError:
-        sys.stdout.write(f"{ALERT_RED}FAIL{RESET}\n")
-        print(
-            f"{ALERT_RED}  [!] Error: Connection failed for page {page_number}. Check your internet connection or URL.{RESET}"
+        sys.stdout.write(
+            f"{status}{ALERT_RED}FAIL{RESET}\n"
+            f"{ALERT_RED}  [!] Error: Connection failed for page {page_number}. Check your internet connection or URL.{RESET}\n"
         )
-        return []
-    except requests.exceptions.HTTPError as e:
-        sys.stdout.write(f"{ALERT_RED}HTTP ERROR {e.response.status_code}{RESET}\n")
-        print(
-            f"{ALERT_RED}  [!] HTTP Error {e.response.status_code} for page {page_number}: {e}. The page might not exist.{RESET}"
-        )
-        return []
+        return None
     except requests.exceptions.RequestException as e:
-        sys.stdout.write(f"{ALERT_RED}ERROR{RESET}\n")
-        print(
-            f"{ALERT_RED}  [!] An unexpected request error occurred for page {page_number}: {e}{RESET}"
+        sys.stdout.write(
+            f"{status}{ALERT_RED}ERROR{RESET}\n"
+            f"{ALERT_RED}  [!] An unexpected request error occurred for page {page_number}: {e}{RESET}\n"
         )
-        return []
-
-    soup = BeautifulSoup(res.text, "html.parser")
-    asn_numbers = []
-
-    for row in soup.select("table#country-report tbody tr"):
-        td = row.find("td")
-        if td:
-            asn_text = td.get_text(strip=True)
-            if asn_text.upper().startswith("AS"):
-                number = asn_text.upper().replace("AS", "").strip()
-                if number.isdigit():
-                    asn_numbers.append(number)
+        return None
+    finally:
+        record_fetch("page", started, res, asn_numbers, country=country, page=page_number)
+    source = " (cached)" if res.from_cache else ""
 
     if asn_numbers:
-        print(
-            f"{SUCCESS_GREEN}  [✓] Successfully extracted {len(asn_numbers)} ASNs from page {page_number}.{RESET}"
+        sys.stdout.write(
+            f"{status}{SUCCESS_GREEN}SUCCESS{source}{RESET}\n"
+            f"{SUCCESS_GREEN}  [✓] Successfully extracted {len(asn_numbers)} ASNs from page {page_number}.{RESET}\n"
         )
     else:
-        print(
-            f"{WARNING_ORANGE}  [i] No ASNs found on page {page_number}. This might be the last page with data.{RESET}"
+        sys.stdout.write(
+            f"{status}{SUCCESS_GREEN}SUCCESS{source}{RESET}\n"
+            f"{WARNING_ORANGE}  [i] No ASNs found on page {page_number}. This might be the last page with data.{RESET}\n"
         )
-    return asn_numbers
+    sys.stdout.flush()
+    return asn_numbers, last_linked_page(res.text)
+
+
+def get_asns_from_pages(
+    pages,
+    workers=DEFAULT_WORKERS,
+    report_url=REPORT_URL,
+    cache=None,
+    country=DEFAULT_COUNTRY,
+    scheduler=None,
+):
+    """
+    Fetches several report pages concurrently over one keep-alive session.
+    Returns (asns, failed_pages): the unique ASNs in page order, keeping the first
+    occurrence of each, and the pages that could not be fetched.
+    """
+    return scan_countries([country], pages, workers, report_url, cache, scheduler)[country]
+
+
+class PageCursor:
+    """
+    Decides which report pages of one country are still worth requesting.
+    With explicit pages it simply hands them out. Otherwise it paginates automatically:
+    page 1 goes first and pages named by pagination links are known to exist. Pages
+    beyond the known ones are only guessed at, `lookahead` at a time, when the report
+    has no pagination links. Nothing is requested past the first empty page, a page
+    that links to no later page, or a page that adds no new ASNs, which is what a
+    server that ignores or clamps ?page= returns. max_pages defaults to DEFAULT_MAX_PAGES.
+    """
+
+    def __init__(self, country, pages=None, max_pages=None, lookahead=DEFAULT_WORKERS):
+        self.country = country
+        self._pages = iter(pages) if pages is not None else None
+        self.next_page = 1
+        self.limit = max_pages or DEFAULT_MAX_PAGES
+        self.seen = set()
+        self.known = 0
+        self.lookahead = lookahead
+        self.answered = False
+        self.linked = False
+
+    def take(self):
+        """Returns the next page to request now, or None if none is due yet."""
+        if self._pages is not None:
+            return next(self._pages, None)
+        if not self.answered:
+            frontier = 1
+        elif self.linked:
+            frontier = self.known
+        else:
+            frontier = self.known + self.lookahead
+        if self.next_page > min(self.limit, frontier):
+            return None
+        page = self.next_page
+        self.next_page += 1
+        return page
+
+    def record(self, page, result):
+        """Takes in a page's (asns, last_linked_page) result, or None if it failed."""
+        self.answered = True
+        if self._pages is not None:
+            return
+        if result is None:
+            # Step past a failed page so its links cannot stall the scan.
+            self.known = max(self.known, page)
+            return
+        asns, last_linked = result
+        if not asns:
+            self.limit = min(self.limit, page - 1)
+            return
+        if self.seen.issuperset(asns):
+            self.limit = min(self.limit, page)
+            return
+        self.seen.update(asns)
+        self.known = max(self.known, page, last_linked or 0)
+        if last_linked is not None:
+            self.linked = True
+            if last_linked <= page:
+                self.limit = min(self.limit, page)
+
+
+def iter_report_pages(
+    countries,
+    pages=None,
+    workers=DEFAULT_WORKERS,
+    report_url=REPORT_URL,
+    cache=None,
+    scheduler=None,
+    max_pages=None,
+    journal=None,
+):
+    """
+    Fetches report pages for several countries over one keep-alive session, one thread pool
+    and one RequestScheduler, sharing the workers between countries.
+    With pages=None every country is paginated automatically until its first empty or last page.
+    Yields (country, page, asns) in completion order; asns is None for pages that failed.
+    With a Journal, pages it already holds are replayed from it without a request, and
+    every newly fetched page is checkpointed to it.
+    """
+    scheduler = scheduler or RequestScheduler()
+    cursors = [PageCursor(country, pages, max_pages, workers) for country in countries]
+    with create_session(workers, HEADERS) as session:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            while True:
+                progressed = True
+                while progressed and len(futures) < workers:
+                    progressed = False
+                    for cursor in cursors:
+                        if len(futures) >= workers:
+                            break
+                        page = cursor.take()
+                        if page is None:
+                            continue
+                        progressed = True
+                        key = f"{cursor.country}:{page}"
+                        if journal is not None and key in journal.done:
+                            page_asns, last_linked = journal.done[key]
+                            cursor.record(page, (page_asns, last_linked))
+                            yield cursor.country, page, page_asns
+                            continue
+                        future = pool.submit(
+                            fetch_report_page,
+                            page,
+                            session,
+                            report_url,
+                            cache,
+                            cursor.country,
+                            scheduler,
+                        )
+                        futures[future] = (cursor, page)
+                if not futures:
+                    return
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    cursor, page = futures.pop(future)
+                    result = future.result()
+                    cursor.record(page, result)
+                    if journal is not None and result is not None:
+                        journal.record(f"{cursor.country}:{page}", list(result))
+                    yield cursor.country, page, None if result is None else result[0]
+
+
+def scan_countries(
+    countries,
+    pages=None,
+    workers=DEFAULT_WORKERS,
+    report_url=REPORT_URL,
+    cache=None,
+    scheduler=None,
+    max_pages=None,
+    journal=None,
+):
+    """
+    Collects ASNs for several countries at once; see iter_report_pages.
+    Returns {country: (asns, failed_pages)} with each country's unique ASNs in page order.
+    """
+    collected = {country: {} for country in countries}
+    failed = {country: [] for country in countries}
+    for country, page, page_asns in iter_report_pages(
+        countries, pages, workers, report_url, cache, scheduler, max_pages, journal
+    ):
+        if page_asns is None:
+            failed[country].append(page)
+        else:
+            collected[country][page] = page_asns
+    results = {}
+    for country in countries:
+        ordered = [asn for page in sorted(collected[country]) for asn in collected[country][page]]
+        results[country] = (list(dict.fromkeys(ordered)), sorted(failed[country]))
+    return results
 
 
 # --- Loading Animation (Themed) ---
@@ -115,9 +409,139 @@ def loading_animation(message, duration=2):
     sys.stdout.flush()
 
 
+# --- Command-Line Interface ---
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_PARTIAL = 3
+
+
+def disable_colors():
+    """Blanks the ANSI style constants so status lines stay readable in logs."""
+    for name, value in list(globals().items()):
+        if name.isupper() and isinstance(value, str) and value.startswith("\033["):
+            globals()[name] = ""
+
+
+def parse_page_range(text):
+    """Parses '5' or '1-20' into a range of page numbers."""
+    start_str, _, end_str = text.partition("-")
+    start_page = int(start_str)
+    end_page = int(end_str) if end_str else start_page
+    if start_page < 1 or start_page > end_page:
+        raise ValueError("start and end must be positive, and start <= end")
+    return range(start_page, end_page + 1)
+
+
+def page_range_arg(text):
+    try:
+        return parse_page_range(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"invalid page range '{text}': {e}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="asnfinder",
+        description="Scrape ASN numbers for countries from BGPView. Run without arguments for the interactive menu.",
+    )
+    parser.add_argument("--country", nargs="+", default=[DEFAULT_COUNTRY], help="ISO country codes")
+    parser.add_argument("--pages", type=page_range_arg, help="page or range, e.g. 1-20 (default: every page)")
+    parser.add_argument("--max-pages", type=positive_int, help=f"stop automatic pagination after this page (default: {DEFAULT_MAX_PAGES})")
+    parser.add_argument("--out", default="ASNFinder(Log).txt", help="output file for all countries, '-' for stdout")
+    parser.add_argument("--country-out", help="also write each country's ASNs to this path, e.g. 'ASNFinder({country}).txt'")
+    parser.add_argument("--workers", type=positive_int, default=DEFAULT_WORKERS)
+    parser.add_argument("--report-url", default=REPORT_URL, help="report URL template with {country} and {page} fields")
+    parser.add_argument("--cache-mode", choices=CACHE_MODES, default=DEFAULT_MODE)
+    parser.add_argument("--quiet", action="store_true", help="suppress progress messages")
+    add_scheduler_arguments(parser)
+    add_journal_arguments(parser)
+    add_metrics_arguments(parser)
+    return parser
+
+
+def write_asns(asns, path, out):
+    content = "".join(f"{asn}\n" for asn in sorted(asns, key=int))
+    if path == "-":
+        out.write(content)
+        out.flush()
+    else:
+        with open(path, "w") as f:
+            f.write(content)
+        print(f"{SUCCESS_GREEN}  [✓] {len(asns)} unique ASNs saved to '{path}'.{RESET}")
+
+
+def command_scan(args, out):
+    countries = list(dict.fromkeys(country.upper() for country in args.country))
+    try:
+        journal = journal_from_args(args, "asnfinder")
+    except ValueError as e:
+        print(f"{ALERT_RED}  [!] Cannot resume: {e}{RESET}")
+        return EXIT_ERROR
+    if journal is not None and journal.done:
+        print(f"{MEDIUM_GRAY}  [i] Resuming: {len(journal.done)} pages already fetched.{RESET}")
+
+    with ResponseCache(mode=args.cache_mode) as cache, contextlib.ExitStack() as stack:
+        if journal is not None:
+            stack.enter_context(journal)
+        results = scan_countries(
+            countries,
+            args.pages,
+            args.workers,
+            args.report_url,
+            cache,
+            scheduler_from_args(args),
+            args.max_pages,
+            journal,
+        )
+        print(f"{MEDIUM_GRAY}  [i] Response cache: {cache.summary()}{RESET}")
+
+    all_asns = {}
+    failed_pages = []
+    for country, (asns, failed) in results.items():
+        all_asns.update(dict.fromkeys(asns))
+        failed_pages.extend(f"{country}:{page}" for page in failed)
+        if args.country_out:
+            write_asns(asns, args.country_out.format(country=country), out)
+    write_asns(all_asns, args.out, out)
+    if failed_pages:
+        print(
+            f"{ALERT_RED}  [!] {len(failed_pages)} pages failed: {' '.join(failed_pages)}{RESET}"
+        )
+        if journal is not None:
+            print(f"{MEDIUM_GRAY}  [i] Retry only the failed pages with --resume '{journal.path}'.{RESET}")
+        return EXIT_PARTIAL
+    if journal is not None:
+        journal.discard()
+    return EXIT_OK
+
+
+def run_cli(argv):
+    """Runs one non-interactive scan and returns its exit code."""
+    args = build_parser().parse_args(argv)
+    out = sys.stdout
+    if not sys.stderr.isatty():
+        disable_colors()
+    with contextlib.ExitStack() as stack:
+        status = stack.enter_context(open(os.devnull, "w")) if args.quiet else sys.stderr
+        stack.enter_context(contextlib.redirect_stdout(status))
+        stack.enter_context(instrumented(args))
+        try:
+            return command_scan(args, out)
+        except KeyboardInterrupt:
+            return 130
+        except (OSError, ValueError, EOFError) as e:
+            sys.stderr.write(f"asnfinder: {e or type(e).__name__}\n")
+            return EXIT_ERROR
+
+
 # --- Main Logic (Themed) ---
-def main():
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        sys.exit(run_cli(argv))
+
     all_asn_numbers = []
+    cache = ResponseCache()
 
     while True:
         print(
@@ -141,6 +565,12 @@ def main():
         print(
             f"{BOLD}{DEEP_PURPLE} ║                                                 ║{RESET}"
         )
+        print(
+            f"{BOLD}{DEEP_PURPLE} ║ {RESET}{BOLD}{ORANGE}[{RESET}{BOLD}{VIBRANT_PURPLE}3{RESET}{BOLD}{ORANGE}]{RESET} {VIBRANT_PURPLE}Scan All Pages                              {RESET}{BOLD}{DEEP_PURPLE}║{RESET}"
+        )
+        print(
+            f"{BOLD}{DEEP_PURPLE} ║                                                 ║{RESET}"
+        )
         print(
             f"{BOLD}{DEEP_PURPLE} ║ {RESET}{BOLD}{ORANGE}[{RESET}{BOLD}{ALERT_RED}E{RESET}{BOLD}{ORANGE}]{RESET} {BOLD}{ALERT_RED}Exit                                        {RESET}{BOLD}{DEEP_PURPLE}║{RESET}"
         )
@@ -157,6 +587,7 @@ def main():
             break
 
         pages_to_process = []
+        countries = [DEFAULT_COUNTRY]
         if user_choice == "1":
             try:
                 page_num_str = input(
@@ -198,19 +629,38 @@ def main():
                 )
                 time.sleep(1.5)
                 continue
+        elif user_choice == "3":
+            country_str = input(
+                f"{BRIGHT_WHITE}[{RESET}{PROMPT_MAGENTA}~{RESET}{BRIGHT_WHITE}]{RESET}{BOLD}{PROMPT_MAGENTA} Enter country codes (e.g., IR AE, empty for {DEFAULT_COUNTRY}): {RESET}"
+            ).strip()
+            countries = [c.upper() for c in country_str.replace(",", " ").split()] or countries
+            if not all(len(c) == 2 and c.isalpha() for c in countries):
+                print(
+                    f"{ALERT_RED}  [!] Invalid input: Please use two-letter country codes.{RESET}"
+                )
+                time.sleep(1.5)
+                continue
+            pages_to_process = None
         else:
             print(
-                f"{ALERT_RED}  [!] Invalid selection: Please choose 1, 2 or E.{RESET}"
+                f"{ALERT_RED}  [!] Invalid selection: Please choose 1, 2, 3 or E.{RESET}"
             )
             time.sleep(1.5)  # Added sleep for consistent behavior
             continue
 
-        if pages_to_process:
+        if pages_to_process is None or pages_to_process:
             print(f"\n{BOLD}{LIGHT_PURPLE}--- Initiating ASN Collection ---{RESET}")
-            for page_num in pages_to_process:
-                current_asns = get_asns_from_page(page_num)
-                all_asn_numbers.extend(current_asns)
-                time.sleep(0.1)
+            # Collect page by page, so Ctrl+C keeps the pages already fetched.
+            try:
+                for _, _, page_asns in iter_report_pages(
+                    countries, pages_to_process, DEFAULT_WORKERS, cache=cache
+                ):
+                    all_asn_numbers.extend(page_asns or ())
+            except KeyboardInterrupt:
+                print(
+                    f"\n{ALERT_RED}  [!] Scan interrupted (Ctrl+C). Saving the ASNs collected so far.{RESET}"
+                )
+                break
 
             print(f"\n{BOLD}{LIGHT_PURPLE}--- Collection Summary ---{RESET}")
             unique_count = len(set(all_asn_numbers))
@@ -220,6 +670,7 @@ def main():
             print(
                 f"{WARNING_ORANGE}  [>] Total unique ASNs gathered so far: {unique_count}{RESET}"
             )
+            print(f"{MEDIUM_GRAY}  [i] Response cache: {cache.summary()}{RESET}")
             loading_animation("  Processing collected data... ", 1.5)
 
             continue_choice = (
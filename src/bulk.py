@@ -0,0 +1,284 @@
+import bz2
+import gzip
+import io
+import lzma
+import socket
+import struct
+import sys
+from collections import namedtuple
+
+from aggregate import range_to_cidrs
+from prefixset import PREFIXLEN_BITS, PrefixSet, pack
+
+# --- Dataset Files ---
+# Compressed files are recognised by their magic bytes, so names do not matter.
+COMPRESSED = {
+    b"\x1f\x8b": gzip.open,
+    b"BZh": bz2.open,
+    b"\xfd7zXZ\x00": lzma.open,
+}
+READ_BUFFER = 1 << 20
+
+
+def open_dataset(path, binary=False):
+    """
+    Opens a local dataset for streaming, transparently decompressing gzip, bzip2 and xz.
+    path '-' reads stdin. Text mode yields lines; binary mode is for MRT dumps.
+    """
+    if path == "-":
+        raw = sys.stdin.buffer
+    else:
+        raw = open(path, "rb", buffering=READ_BUFFER)
+    head = raw.peek(6)[:6] if hasattr(raw, "peek") else b""
+    for magic, opener in COMPRESSED.items():
+        if head.startswith(magic):
+            raw = opener(raw)
+            break
+    if binary:
+        return raw
+    return io.TextIOWrapper(raw, encoding="utf-8", errors="replace")
+
+
+def _address(text):
+    """Returns (version, integer) for an IPv4 or IPv6 address string."""
+    if ":" in text:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, text), "big")
+    return 4, int.from_bytes(socket.inet_aton(text), "big")
+
+
+def _origin_asns(field):
+    """Splits a pfx2as origin field: '13335', MOAS '13335_4826' or an AS set '{1,2}'."""
+    return field.strip("{}").replace("_", ",").split(",")
+
+
+# --- pfx2as / RouteViews Prefix-to-AS ---
+def iter_pfx2as(lines):
+    """
+    Yields (asn, version, network, prefixlen) from prefix-to-AS lines.
+    Accepts CAIDA's 'address<TAB>length<TAB>asns' and the 'address/length asns' form;
+    comments, blank lines and malformed rows are skipped.
+    """
+    for line in lines:
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        try:
+            if "/" in fields[0]:
+                address, _, length = fields[0].partition("/")
+                origins = fields[1]
+            else:
+                address, length, origins = fields[0], fields[1], fields[2]
+            version, network = _address(address)
+            prefixlen = int(length)
+        except (IndexError, OSError, ValueError):
+            continue
+        bits = 32 if version == 4 else 128
+        if not 0 <= prefixlen <= bits:
+            continue
+        network &= ~((1 << (bits - prefixlen)) - 1)
+        if origins.isdigit():
+            yield origins, version, network, prefixlen
+            continue
+        for asn in _origin_asns(origins):
+            if asn.isdigit():
+                yield asn, version, network, prefixlen
+
+
+# --- RIR Delegated Statistics ---
+DelegatedRecord = namedtuple(
+    "DelegatedRecord", "registry country kind start value status opaque_id"
+)
+DELEGATED_STATUSES = ("allocated", "assigned")
+
+
+def iter_delegated(lines):
+    """
+    Yields a DelegatedRecord for every allocated or assigned asn/ipv4/ipv6 row of an
+    RIR delegated-stats file. The opaque_id is only present in the extended format.
+    """
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        fields = line.rstrip("\n").split("|")
+        if len(fields) < 7 or fields[1] == "*" or fields[2] not in ("asn", "ipv4", "ipv6"):
+            continue
+        if fields[6] not in DELEGATED_STATUSES:
+            continue
+        yield DelegatedRecord(
+            fields[0],
+            fields[1].upper(),
+            fields[2],
+            fields[3],
+            fields[4],
+            fields[6],
+            fields[7] if len(fields) > 7 else None,
+        )
+
+
+def delegated_blocks(record):
+    """
+    Returns the (version, network, prefixlen) blocks of an ipv4/ipv6 record.
+    IPv4 rows give an address count that need not be a power of two, so they may span several blocks.
+    """
+    version, network = _address(record.start)
+    if version == 6:
+        return [(6, network, int(record.value))]
+    end = network + int(record.value) - 1
+    return [(4, start, prefixlen) for start, prefixlen in range_to_cidrs(network, end)]
+
+
+def delegated_asns(record):
+    start = int(record.start)
+    return [str(asn) for asn in range(start, start + int(record.value))]
+
+
+def read_delegated(lines, countries=None):
+    """
+    Reads a delegated-stats file into (asns, asn_prefixes).
+    asns lists every ASN registered to the given countries (all countries when None).
+    asn_prefixes maps each of those ASNs to the address blocks registered to the same
+    holder, which the extended format links through its opaque-id; plain files, having
+    no such link, leave it empty.
+    """
+    countries = {c.upper() for c in countries} if countries else None
+    asn_holders = {}
+    holder_blocks = {}
+    for record in iter_delegated(lines):
+        if countries is not None and record.country not in countries:
+            continue
+        if record.kind == "asn":
+            for asn in delegated_asns(record):
+                asn_holders[asn] = record.opaque_id
+        elif record.opaque_id is not None:
+            holder_blocks.setdefault(record.opaque_id, []).extend(delegated_blocks(record))
+
+    asn_prefixes = {}
+    for asn, holder in asn_holders.items():
+        blocks = holder_blocks.get(holder)
+        if blocks:
+            prefixes = asn_prefixes[asn] = PrefixSet()
+            for version, network, prefixlen in blocks:
+                prefixes.update_keys([pack(network, prefixlen)], version)
+    return list(asn_holders), asn_prefixes
+
+
+# --- MRT RIB Dumps (RFC 6396) ---
+MRT_HEADER = struct.Struct(">IHHI")
+MRT_TABLE_DUMP_V2 = 13
+RIB_SUBTYPES = {2: 4, 4: 6}  # RIB_IPV4_UNICAST, RIB_IPV6_UNICAST
+ATTR_AS_PATH = 2
+AS_SET = 1
+
+
+def _path_origins(attributes):
+    """Returns the origin ASNs in a BGP attribute block; TABLE_DUMP_V2 always uses 4-byte AS numbers."""
+    offset = 0
+    while offset + 3 <= len(attributes):
+        flags, kind = attributes[offset], attributes[offset + 1]
+        if flags & 0x10:
+            length = int.from_bytes(attributes[offset + 2 : offset + 4], "big")
+            offset += 4
+        else:
+            length = attributes[offset + 2]
+            offset += 3
+        if kind != ATTR_AS_PATH:
+            offset += length
+            continue
+        path, position, last = attributes[offset : offset + length], 0, None
+        while position + 2 <= len(path):
+            segment_type, count = path[position], path[position + 1]
+            asns = struct.unpack_from(f">{count}I", path, position + 2)
+            position += 2 + 4 * count
+            if asns:
+                last = asns if segment_type == AS_SET else asns[-1:]
+        return last or ()
+    return ()
+
+
+def _rib_entry(body, bits):
+    """Decodes a RIB entry body into (network, prefixlen, origins), or None if it is malformed."""
+    try:
+        prefixlen = body[4]
+        width = (prefixlen + 7) // 8
+        if prefixlen > bits or 5 + width > len(body):
+            return None
+        network = int.from_bytes(body[5 : 5 + width], "big") << (bits - 8 * width)
+        network &= ~((1 << (bits - prefixlen)) - 1)
+        offset = 5 + width
+        (entries,) = struct.unpack_from(">H", body, offset)
+        offset += 2
+        origins = set()
+        for _ in range(entries):
+            (attr_length,) = struct.unpack_from(">H", body, offset + 6)
+            offset += 8
+            if offset + attr_length > len(body):
+                return None
+            origins.update(_path_origins(body[offset : offset + attr_length]))
+            offset += attr_length
+    except (IndexError, struct.error):
+        return None
+    return network, prefixlen, origins
+
+
+def iter_mrt(f):
+    """
+    Yields (asn, version, network, prefixlen) from a TABLE_DUMP_V2 RIB file, one record
+    at a time. Each prefix is reported once per distinct origin across all peers;
+    malformed RIB entries are skipped, like malformed pfx2as rows.
+    """
+    while True:
+        header = f.read(MRT_HEADER.size)
+        if len(header) < MRT_HEADER.size:
+            return
+        _, kind, subtype, length = MRT_HEADER.unpack(header)
+        body = f.read(length)
+        if len(body) < length:
+            return
+        if kind != MRT_TABLE_DUMP_V2 or subtype not in RIB_SUBTYPES:
+            continue
+        version = RIB_SUBTYPES[subtype]
+        entry = _rib_entry(body, 32 if version == 4 else 128)
+        if entry is None:
+            continue
+        network, prefixlen, origins = entry
+        for asn in origins:
+            yield str(asn), version, network, prefixlen
+
+
+# --- Ingestion ---
+def collect(records, asns=None, asn_prefixes=None):
+    """
+    Groups (asn, version, network, prefixlen) records into {asn: PrefixSet}, the same mapping
+    that fetch_announced_prefixes builds one ASN at a time. With asns, other ASNs are skipped.
+    """
+    asn_prefixes = {} if asn_prefixes is None else asn_prefixes
+    wanted = set(asns) if asns is not None else None
+    # Plain key lists are much cheaper to grow than one PrefixSet per ASN.
+    keys = {}
+    for asn, version, network, prefixlen in records:
+        if wanted is not None and asn not in wanted:
+            continue
+        family_keys = keys.get(asn)
+        if family_keys is None:
+            family_keys = keys[asn] = {4: [], 6: []}
+        family_keys[version].append(network << PREFIXLEN_BITS | prefixlen)
+    for asn, family_keys in keys.items():
+        prefixes = asn_prefixes.get(asn)
+        if prefixes is None:
+            prefixes = asn_prefixes[asn] = PrefixSet()
+        for version, version_keys in family_keys.items():
+            if version_keys:
+                prefixes.update_keys(version_keys, version)
+    return asn_prefixes
+
+
+def ingest(pfx2as=(), mrt=(), asns=None):
+    """Streams pfx2as and MRT files into one {asn: PrefixSet} mapping, optionally limited to asns."""
+    asn_prefixes = {}
+    for path in pfx2as:
+        with open_dataset(path) as f:
+            collect(iter_pfx2as(f), asns, asn_prefixes)
+    for path in mrt:
+        with open_dataset(path, binary=True) as f:
+            collect(iter_mrt(f), asns, asn_prefixes)
+    return asn_prefixes
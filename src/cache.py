@@ -0,0 +1,155 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from metrics import METRICS
+
+# --- Cache Configuration ---
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "ipshin",
+)
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, "responses.sqlite3")
+DEFAULT_TTL = 12 * 60 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# default: serve fresh entries, revalidate stale ones
+# refresh: revalidate every entry regardless of age
+# only:    never touch the network, serve whatever is cached
+# bypass:  neither read nor write the cache
+CACHE_MODES = ("default", "refresh", "only", "bypass")
+DEFAULT_MODE = os.environ.get("IPSHIN_CACHE_MODE", "default")
+
+
+class ResponseCache:
+    """
+    Persistent SQLite cache for HTTP response bodies, keyed by URL.
+    Entries carry their ETag/Last-Modified validators and are evicted least-recently-used
+    once the stored bodies exceed max_bytes.
+    """
+
+    def __init__(
+        self,
+        path=DEFAULT_CACHE_PATH,
+        ttl=DEFAULT_TTL,
+        max_bytes=DEFAULT_MAX_BYTES,
+        mode=DEFAULT_MODE,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of {CACHE_MODES}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "stale": 0}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " url TEXT PRIMARY KEY,"
+            " body BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " fetched_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)"
+        )
+        self._db.commit()
+
+    @property
+    def enabled(self):
+        return self.mode != "bypass"
+
+    def get(self, url):
+        """Returns the cached entry for url as a dict, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), url)
+            )
+            self._db.commit()
+        body, etag, last_modified, fetched_at = row
+        return {
+            "body": zlib.decompress(body).decode("utf-8"),
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": fetched_at,
+        }
+
+    def is_fresh(self, entry):
+        return self.mode != "refresh" and time.time() - entry["fetched_at"] < self.ttl
+
+    def put(self, url, body, etag=None, last_modified=None):
+        """Stores a response body and evicts old entries if the cache grew too large."""
+        blob = zlib.compress(body.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, blob, len(blob), etag, last_modified, now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def touch(self, url):
+        """Marks an entry as fresh again after a 304 Not Modified."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE url = ?",
+                (now, now, url),
+            )
+            self._db.commit()
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+        METRICS.inc("ipshin_cache_total", result=key)
+
+    def _evict(self):
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute(
+            "SELECT url, size FROM responses ORDER BY accessed_at"
+        ).fetchall()
+        doomed = []
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((url,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE url = ?", doomed)
+
+    def summary(self):
+        s = self.stats
+        return (
+            f"{s['hits']} hits, {s['revalidated']} revalidated, "
+            f"{s['misses']} misses, {s['stale']} stale"
+        )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,266 @@
+import contextlib
+import json
+import os
+import struct
+import tempfile
+import time
+
+from metrics import METRICS
+from prefixset import PrefixSet, unpack
+
+# --- Export Configuration ---
+FORMATS = ("txt", "surge", "clash", "sing-box", "nftables", "ipset", "mmdb")
+DEFAULT_POLICY = "DIRECT"
+DEFAULT_FINAL = "PROXY"
+DEFAULT_SET_NAME = "ipshin"
+WRITE_BUFFER = 1 << 20
+
+
+@contextlib.contextmanager
+def atomic_write(path, binary=False):
+    """
+    Opens a temporary file next to path and renames it over path once the block succeeds,
+    so readers never see a half-written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        if binary:
+            f = os.fdopen(fd, "wb", buffering=WRITE_BUFFER)
+        else:
+            f = os.fdopen(fd, "w", buffering=WRITE_BUFFER, encoding="utf-8", newline="\n")
+        with f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+def prefix_strings(prefixes):
+    """Returns the prefixes as CIDR strings, in the order given."""
+    if isinstance(prefixes, PrefixSet):
+        return prefixes.to_text().splitlines()
+    return [str(p) for p in prefixes]
+
+
+# --- Text Renderers ---
+def render_txt(cidrs, options):
+    return [f"{c}\n" for c in cidrs]
+
+
+def render_surge(cidrs, options):
+    policy = options.get("policy", DEFAULT_POLICY)
+    lines = ["[Rule]\n"]
+    lines.extend(
+        f"IP-CIDR6,{c},{policy}\n" if ":" in c else f"IP-CIDR,{c},{policy}\n"
+        for c in cidrs
+    )
+    lines.append(f"FINAL,{options.get('final', DEFAULT_FINAL)}\n")
+    return lines
+
+
+def render_clash(cidrs, options):
+    lines = ["payload:\n"]
+    lines.extend(f"  - '{c}'\n" for c in cidrs)
+    return lines
+
+
+def render_sing_box(cidrs, options):
+    return [json.dumps({"version": 1, "rules": [{"ip_cidr": cidrs}]}, indent=2), "\n"]
+
+
+def split_families(cidrs):
+    """Splits CIDR strings into (ipv4, ipv6) lists, keeping their order."""
+    ipv4, ipv6 = [], []
+    for c in cidrs:
+        (ipv6 if ":" in c else ipv4).append(c)
+    return ipv4, ipv6
+
+
+def render_nftables(cidrs, options):
+    name = options.get("set_name", DEFAULT_SET_NAME)
+    ipv4, ipv6 = split_families(cidrs)
+    lines = [f"table inet {name} {{\n"]
+    for suffix, addr_type, members in (("4", "ipv4_addr", ipv4), ("6", "ipv6_addr", ipv6)):
+        if suffix == "6" and not members:
+            continue
+        lines.extend(
+            [f"\tset {name}{suffix} {{\n", f"\t\ttype {addr_type}\n", "\t\tflags interval\n"]
+        )
+        if members:
+            lines.append("\t\telements = {\n\t\t\t")
+            lines.append(",\n\t\t\t".join(members))
+            lines.append("\n\t\t}\n")
+        lines.append("\t}\n")
+    lines.append("}\n")
+    return lines
+
+
+def render_ipset(cidrs, options):
+    name = options.get("set_name", DEFAULT_SET_NAME)
+    ipv4, ipv6 = split_families(cidrs)
+    lines = [
+        f"create {name} hash:net family inet maxelem {max(65536, len(ipv4))} -exist\n"
+    ]
+    lines.extend(f"add {name} {c} -exist\n" for c in ipv4)
+    if ipv6:
+        lines.append(
+            f"create {name}6 hash:net family inet6 maxelem {max(65536, len(ipv6))} -exist\n"
+        )
+        lines.extend(f"add {name}6 {c} -exist\n" for c in ipv6)
+    return lines
+
+
+# --- MaxMind DB Writer ---
+METADATA_MARKER = b"\xab\xcd\xefMaxMind.com"
+
+
+def _control(type_id, size):
+    """Encodes a MaxMind DB control byte (plus extended type and size bytes)."""
+    extended = b""
+    if type_id > 7:
+        extended = bytes([type_id - 7])
+        type_id = 0
+    if size < 29:
+        head, tail = size, b""
+    elif size < 285:
+        head, tail = 29, bytes([size - 29])
+    elif size < 65821:
+        head, tail = 30, (size - 285).to_bytes(2, "big")
+    else:
+        head, tail = 31, (size - 65821).to_bytes(3, "big")
+    return bytes([type_id << 5 | head]) + extended + tail
+
+
+def _uint(type_id, value):
+    raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return _control(type_id, len(raw)) + raw
+
+
+def encode_mmdb(value):
+    """Encodes a Python value in the MaxMind DB data-section format."""
+    if isinstance(value, bool):
+        return _control(14, int(value))
+    if isinstance(value, str):
+        raw = value.encode("utf-8")
+        return _control(2, len(raw)) + raw
+    if isinstance(value, float):
+        return _control(3, 8) + struct.pack(">d", value)
+    if isinstance(value, bytes):
+        return _control(4, len(value)) + value
+    if isinstance(value, int):
+        if value < 0:
+            raise ValueError("negative integers are not supported")
+        return _uint(6 if value < 1 << 32 else 9 if value < 1 << 64 else 10, value)
+    if isinstance(value, dict):
+        out = [_control(7, len(value))]
+        for key, item in value.items():
+            out.append(encode_mmdb(str(key)))
+            out.append(encode_mmdb(item))
+        return b"".join(out)
+    if isinstance(value, (list, tuple)):
+        return _control(11, len(value)) + b"".join(encode_mmdb(v) for v in value)
+    raise TypeError(f"cannot encode {type(value).__name__} in a MaxMind DB")
+
+
+def build_mmdb(
+    blocks, data, database_type="Ipshin-Domestic", description="Ipshin prefix list", ip_version=4
+):
+    """
+    Builds a MaxMind DB where every (network, prefixlen) block maps to one data record.
+    Blocks must not overlap, which holds for aggregated prefix lists. For ip_version=6 the
+    blocks are 128-bit; IPv4 networks belong under ::/96, as MaxMind readers expect.
+    """
+    bits = 32 if ip_version == 4 else 128
+    data_section = encode_mmdb(data)
+    left, right = [0], [0]
+    data_marker = -1
+    for network, prefixlen in blocks:
+        if prefixlen == 0:
+            left[0] = right[0] = data_marker
+        node = 0
+        for depth in range(prefixlen):
+            side = right if network >> (bits - 1 - depth) & 1 else left
+            if depth == prefixlen - 1:
+                side[node] = data_marker
+            else:
+                if side[node] <= 0:
+                    left.append(0)
+                    right.append(0)
+                    side[node] = len(left) - 1
+                node = side[node]
+
+    node_count = len(left)
+    data_record = node_count + 16
+    record_size = 24 if data_record < 1 << 24 else 32
+    width = record_size // 8
+
+    def record(value):
+        if value == data_marker:
+            value = data_record
+        elif value == 0:
+            value = node_count
+        return value.to_bytes(width, "big")
+
+    tree = bytearray()
+    for l_value, r_value in zip(left, right):
+        tree += record(l_value) + record(r_value)
+    # Readers check the exact integer types of these fields.
+    fields = [
+        ("node_count", _uint(6, node_count)),
+        ("record_size", _uint(5, record_size)),
+        ("ip_version", _uint(5, ip_version)),
+        ("database_type", encode_mmdb(database_type)),
+        ("languages", encode_mmdb(["en"])),
+        ("binary_format_major_version", _uint(5, 2)),
+        ("binary_format_minor_version", _uint(5, 0)),
+        ("build_epoch", _uint(9, int(time.time()))),
+        ("description", encode_mmdb({"en": description})),
+    ]
+    metadata = _control(7, len(fields)) + b"".join(
+        encode_mmdb(key) + value for key, value in fields
+    )
+    return bytes(tree) + b"\x00" * 16 + data_section + METADATA_MARKER + metadata
+
+
+# --- Export Entry Point ---
+RENDERERS = {
+    "txt": render_txt,
+    "surge": render_surge,
+    "clash": render_clash,
+    "sing-box": render_sing_box,
+    "nftables": render_nftables,
+    "ipset": render_ipset,
+}
+
+
+def render(prefixes, fmt="txt", **options):
+    """
+    Renders prefixes in one of FORMATS, returning text or, for mmdb, bytes.
+    The prefixes are written as given; callers aggregate or collapse them beforehand.
+    """
+    if fmt == "mmdb":
+        blocks = PrefixSet(prefixes).aggregated()
+        data = options.get("data") or {"domestic": True}
+        if not blocks.keys(6):
+            return build_mmdb((unpack(key) for key in blocks.keys(4)), data)
+        mapped = [(network, prefixlen + 96) for network, prefixlen in map(unpack, blocks.keys(4))]
+        mapped.extend(unpack(key) for key in blocks.keys(6))
+        return build_mmdb(mapped, data, ip_version=6)
+    if fmt not in RENDERERS:
+        raise ValueError(f"Unknown format '{fmt}', expected one of {FORMATS}")
+    return "".join(RENDERERS[fmt](prefix_strings(prefixes), options))
+
+
+def export_prefixes(prefixes, path, fmt="txt", **options):
+    """Renders prefixes and writes them to path atomically in a single buffered write."""
+    with METRICS.timed("ipshin_stage_seconds", stage="save"):
+        content = render(prefixes, fmt, **options)
+        with atomic_write(path, binary=isinstance(content, bytes)) as f:
+            f.write(content)
+    METRICS.inc("ipshin_saved_bytes_total", len(content), format=fmt)
@@ -0,0 +1,222 @@
+import argparse
+import email.utils
+import random
+import threading
+import time
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+
+
+# --- Shared HTTP Session ---
+def create_session(pool_size=10, headers=None):
+    """Creates a keep-alive session whose connection pool fits pool_size concurrent workers."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+# --- Rate Limiting and Retries ---
+DEFAULT_RATE = 8.0
+DEFAULT_MAX_RATE = 20.0
+DEFAULT_MIN_RATE = 0.5
+DEFAULT_RETRIES = 4
+DEFAULT_RETRY_BUDGET = 100
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def parse_retry_after(value):
+    """Returns the delay in seconds from a Retry-After header (seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RequestScheduler:
+    """
+    Token-bucket rate limiter with retries, shared by every worker talking to one host.
+    The rate grows additively while requests succeed and is halved on 429/5xx answers;
+    Retry-After pauses all workers. Retries use exponential backoff with full jitter and
+    draw from a run-wide budget so a failing provider cannot stall the run indefinitely.
+    """
+
+    def __init__(
+        self,
+        rate=DEFAULT_RATE,
+        max_rate=DEFAULT_MAX_RATE,
+        min_rate=DEFAULT_MIN_RATE,
+        retries=DEFAULT_RETRIES,
+        retry_budget=DEFAULT_RETRY_BUDGET,
+        backoff=0.5,
+        max_backoff=30.0,
+    ):
+        self.rate = rate
+        self.max_rate = max(max_rate, rate)
+        self.min_rate = min_rate
+        self.retries = retries
+        self.retry_budget = retry_budget
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0}
+        self._tokens = 1.0
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    max(1.0, self.rate), self._tokens + (now - self._stamp) * self.rate
+                )
+                self._stamp = now
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.stats["requests"] += 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def _succeeded(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+    def _throttled(self, retry_after):
+        with self._lock:
+            self.stats["throttled"] += 1
+            METRICS.inc("ipshin_throttled_total")
+            self.rate = max(self.min_rate, self.rate / 2)
+            if retry_after:
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after
+                )
+
+    def _take_retry(self, attempt):
+        with self._lock:
+            if attempt >= self.retries or self.retry_budget <= 0:
+                return False
+            self.retry_budget -= 1
+            self.stats["retries"] += 1
+            METRICS.inc("ipshin_retries_total")
+            return True
+
+    def get(self, session, url, **kwargs):
+        """GETs url under the rate limit, retrying throttled, failed or unreachable requests."""
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                res = session.get(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._throttled(None)
+                if not self._take_retry(attempt):
+                    raise
+                retry_after = None
+            else:
+                if res.status_code not in RETRY_STATUSES:
+                    self._succeeded()
+                    return res
+                retry_after = parse_retry_after(res.headers.get("Retry-After"))
+                self._throttled(retry_after)
+                if not self._take_retry(attempt):
+                    return res
+            delay = retry_after or random.uniform(
+                0, min(self.max_backoff, self.backoff * 2**attempt)
+            )
+            time.sleep(delay)
+            attempt += 1
+
+
+def positive_int(text):
+    """argparse type for counts such as --workers that must be at least 1."""
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got '{text}'")
+    return value
+
+
+def add_scheduler_arguments(parser):
+    """Adds the --rate/--max-rate/--retries options shared by the command-line tools."""
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="initial requests per second")
+    parser.add_argument("--max-rate", type=float, default=DEFAULT_MAX_RATE, help="ceiling for the adaptive rate")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="retries per request")
+
+
+def scheduler_from_args(args):
+    return RequestScheduler(args.rate, args.max_rate, retries=args.retries)
+
+
+# --- Cached Fetching ---
+Fetched = namedtuple("Fetched", "status_code text from_cache")
+CACHE_MISS_STATUS = 504  # what HTTP caches answer for only-if-cached misses
+
+
+def fetch_text(session, url, headers=None, timeout=20, cache=None, scheduler=None):
+    """
+    GETs url, consulting an optional ResponseCache first.
+    Stale entries are revalidated with If-None-Match/If-Modified-Since; requests that
+    go to the network pass through the RequestScheduler when one is given.
+    """
+    use_cache = cache is not None and cache.enabled
+    entry = cache.get(url) if use_cache else None
+    if entry is not None:
+        fresh = cache.is_fresh(entry)
+        if fresh or cache.mode == "only":
+            cache.count("hits" if fresh else "stale")
+            return Fetched(200, entry["body"], True)
+    if use_cache and cache.mode == "only":
+        cache.count("misses")
+        return Fetched(CACHE_MISS_STATUS, "", False)
+
+    request_headers = dict(headers or {})
+    if entry is not None:
+        if entry["etag"]:
+            request_headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            request_headers["If-Modified-Since"] = entry["last_modified"]
+    http = session or requests
+    started = time.perf_counter()
+    if scheduler is not None:
+        res = scheduler.get(http, url, headers=request_headers, timeout=timeout)
+    else:
+        res = http.get(url, headers=request_headers, timeout=timeout)
+    # Includes rate-limit waits and retries, as seen by the caller.
+    METRICS.observe("ipshin_http_request_seconds", time.perf_counter() - started)
+    METRICS.inc("ipshin_http_responses_total", status=str(res.status_code))
+    METRICS.inc("ipshin_http_response_bytes_total", len(res.content))
+
+    if entry is not None and res.status_code == 304:
+        cache.touch(url)
+        cache.count("revalidated")
+        return Fetched(200, entry["body"], True)
+    if use_cache:
+        cache.count("misses")
+        if res.status_code == 200:
+            cache.put(
+                url,
+                res.text,
+                res.headers.get("ETag"),
+                res.headers.get("Last-Modified"),
+            )
+    return Fetched(res.status_code, res.text, False)
@@ -0,0 +1,94 @@
+import ipaddress
+import json
+import os
+import time
+
+from cache import DEFAULT_TTL
+from prefixset import PrefixSet, network_sort_key
+
+# --- State Configuration ---
+DEFAULT_STATE_PATH = "IPFinder(State).json"
+
+
+class PrefixState:
+    """
+    Per-ASN prefix sets remembered between ipfinder runs.
+    Each ASN keeps its announced prefixes, as fetched, and fetch time, so only stale ASNs
+    are refetched and only changed ASNs trigger a new aggregation.
+    """
+
+    def __init__(self, path=DEFAULT_STATE_PATH, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.asns = {}
+        self.output = []
+        self.output_asns = []
+        self.output_collapse = False
+        self.changed = set()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+            self.asns = data.get("asns", {})
+            self.output = data.get("output", [])
+            self.output_asns = data.get("output_asns", [])
+            self.output_collapse = data.get("output_collapse", False)
+
+    def stale_asns(self, asns):
+        """Returns the ASNs that were never fetched or whose data is older than the TTL."""
+        now = time.time()
+        return [
+            asn
+            for asn in asns
+            if asn not in self.asns or now - self.asns[asn]["fetched_at"] >= self.ttl
+        ]
+
+    def update(self, asn, prefixes):
+        """Records freshly fetched prefixes for an ASN, marking it changed only if they differ."""
+        announced = PrefixSet(prefixes).to_text().splitlines()
+        previous = self.asns.get(asn)
+        if previous is None or previous["prefixes"] != announced:
+            self.changed.add(asn)
+        self.asns[asn] = {"fetched_at": time.time(), "prefixes": announced}
+
+    def aggregated(self, asns, collapse=False):
+        """
+        Returns the cleaned prefix list for the given ASNs, with adjacent ranges merged if collapse.
+        The previous output is reused as-is when the ASN list, every ASN's data and collapse are unchanged.
+        """
+        asns = sorted(set(asns), key=int)
+        if not self.changed and asns == self.output_asns and collapse == self.output_collapse:
+            return [ipaddress.ip_network(p) for p in self.output]
+        merged = PrefixSet()
+        for asn in asns:
+            merged.update(self.asns.get(asn, {}).get("prefixes", []))
+        result = list(merged.aggregated(collapse))
+        result.sort(key=network_sort_key)
+        return result
+
+    def commit(self, asns, output, collapse=False):
+        """Remembers the published output and writes the state file."""
+        self.output = [str(p) for p in output]
+        self.output_asns = sorted(set(asns), key=int)
+        self.output_collapse = collapse
+        self.changed.clear()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "asns": self.asns,
+                    "output": self.output,
+                    "output_asns": self.output_asns,
+                    "output_collapse": self.output_collapse,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
+
+
+def diff_prefixes(old, new):
+    """Returns (added, removed) prefix lists between two outputs, in output order."""
+    old_set = set(old)
+    new_set = set(new)
+    added = [p for p in new if p not in old_set]
+    removed = [p for p in old if p not in new_set]
+    return added, removed
@@ -1,8 +1,39 @@
+import argparse
+import contextlib
 import requests
 import ipaddress
 import time
 import sys
 import os
+import re
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from annotated import AnnotatedPrefixes
+from bulk import ingest, open_dataset, read_delegated
+from cache import CACHE_MODES, DEFAULT_MODE, ResponseCache
+from httpclient import (
+    RequestScheduler,
+    add_scheduler_arguments,
+    create_session,
+    fetch_text,
+    positive_int,
+    scheduler_from_args,
+)
+from incremental import DEFAULT_STATE_PATH, PrefixState, diff_prefixes
+from journal import add_journal_arguments, journal_from_args
+from export import (
+    DEFAULT_FINAL,
+    DEFAULT_POLICY,
+    DEFAULT_SET_NAME,
+    FORMATS,
+    export_prefixes,
+    render,
+)
+from lookup import INVALID, LookupIndex
+from metrics import METRICS, add_metrics_arguments, instrumented, record_fetch
+from parallel import add_process_arguments, aggregate_prefixes, parse_prefix_text
+from prefixset import PREFIXLEN_BITS, PrefixSet, network_sort_key, parse_cidr
 
 # --- ANSI Styles ---
 RESET = "\033[0m"
@@ -46,56 +77,323 @@ def loading_animation(message, duration=1.5):
 
 
 # --- Core Logic Functions ---
-def fetch_announced_prefixes(asn):
-    """Fetches announced IP prefixes for a given ASN from BGPView API."""
-    url = f"https://api.bgpview.io/asn/{asn}/prefixes"
-    headers = {"User-Agent": "Mozilla/5.0"}
+API_URL = "https://api.bgpview.io/asn/{asn}/prefixes"
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+DEFAULT_WORKERS = 8
+PREFIX_FIELDS = ("ipv4_prefixes", "ipv6_prefixes")
+FAMILIES = ("4", "6", "both")
+# Bodies this large are scanned by PrefixPayloadParser instead of json.loads. The C json
+# module is faster for typical responses; the scanner keeps big transit ASNs from
+# materialising thousands of dicts and strings per request.
+STREAM_MIN_CHARS = 256 * 1024
 
-    sys.stdout.write(
-        f"{WARNING_ORANGE}  [>] Fetching prefixes for ASN {asn}... {RESET}"
-    )
-    sys.stdout.flush()
+# One anchored match per token of interest: '{', '}', '[' or ']', a "data" or prefix field
+# key, or a "prefix" key with its string value. Every other string, number and separator is
+# skipped inside the regex engine, in an unrolled loop that cannot backtrack badly.
+# A match always ends in a complete token, so text can be fed in chunks: no match means
+# the token is cut off and more text is needed.
+PAYLOAD_TOKEN_RE = re.compile(
+    r'[^"{}\[\]]*'
+    r'(?:"(?!(?:prefix|data|ipv[46]_prefixes)"\s*:)[^"\\]*(?:\\.[^"\\]*)*"[^"{}\[\]]*)*'
+    r'(?:([{}\[\]])|"(data|ipv[46]_prefixes)"\s*:|"prefix"\s*:\s*(?:"([^"\\]*(?:\\.[^"\\]*)*)")?)'
+)
+
+
+class PrefixPayloadParser:
+    """
+    Streaming scanner for BGPView prefix responses that tracks nesting depth instead of
+    building the JSON document. Only the "prefix" of each item in data.ipv4_prefixes
+    and data.ipv6_prefixes is read, not the one of its nested "parent" object, and it is
+    parsed straight to an integer key. Like parse_prefix_payload, a "data" member that is
+    not an object is a ValueError. Feed text chunks, then call close() for the PrefixSet.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._depth = 0
+        self._field = False
+        self._data_key = False
+        self._in_data = False
+        self._item_depth = None
+        self._objects = 0
+        self._keys = {4: [], 6: []}
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        self._scan(final=False)
+
+    def close(self):
+        """Returns the PrefixSet; raises ValueError if the text was not a complete JSON object."""
+        self._scan(final=True)
+        if self._depth or not self._objects or self._buffer.strip():
+            raise ValueError("Truncated or invalid JSON prefix response")
+        prefixes = PrefixSet()
+        for version, keys in self._keys.items():
+            if keys:
+                prefixes.update_keys(keys, version)
+        return prefixes
+
+    def _scan(self, final):
+        text = self._buffer
+        match = PAYLOAD_TOKEN_RE.match
+        pos = 0
+        depth, item_depth = self._depth, self._item_depth
+        while True:
+            m = match(text, pos)
+            if m is None:
+                break
+            bracket, field, prefix = m.groups()
+            if not final and (field == "data" or (bracket is None and field is None and prefix is None)):
+                # A "prefix" key whose value may still be arriving, or a "data" key whose
+                # value has not started yet.
+                rest = text[m.end() :].lstrip()
+                if not rest or (rest[0] == '"' and field is None):
+                    break
+            start, pos = pos, m.end()
+            data_key, self._data_key = self._data_key, False
+            if bracket is not None:
+                if bracket == "{" or bracket == "[":
+                    depth += 1
+                    if bracket == "{" and depth == 1:
+                        self._objects += 1
+                    if bracket == "{" and depth == 2 and data_key:
+                        self._in_data = True
+                    # Only an array that is the field's value, not one after a null value.
+                    if self._field and bracket == "[" and not text[start : m.start(1)].strip():
+                        item_depth = depth + 1
+                else:
+                    depth -= 1
+                    if depth < 2:
+                        self._in_data = False
+                    if item_depth is not None and depth < item_depth - 1:
+                        item_depth = None
+                self._field = False
+            elif field == "data":
+                if depth == 1:
+                    if not text[pos:].lstrip().startswith("{"):
+                        raise ValueError("Prefix response has no data object")
+                    self._data_key = True
+                self._field = False
+            elif field is not None:
+                self._field = depth == 2 and self._in_data
+            else:
+                self._field = False
+                if prefix is not None and depth == item_depth:
+                    if "\\" in prefix:
+                        prefix = json.loads(f'"{prefix}"')
+                    try:
+                        version, network, prefixlen = parse_cidr(prefix)
+                    except ValueError:
+                        continue
+                    self._keys[version].append(network << PREFIXLEN_BITS | prefixlen)
+        if depth < 0:
+            raise ValueError("Invalid JSON prefix response")
+        self._buffer = text[pos:]
+        self._depth, self._item_depth = depth, item_depth
+
+
+def parse_prefix_payload(text):
+    """
+    Turns a BGPView prefix response body into a PrefixSet of its IPv4 and IPv6 prefixes,
+    skipping malformed entries. Raises ValueError if the body is not JSON or its
+    top level or "data" member is not an object.
+    Large bodies go through PrefixPayloadParser to keep peak memory flat.
+    """
+    if len(text) >= STREAM_MIN_CHARS:
+        parser = PrefixPayloadParser()
+        parser.feed(text)
+        return parser.close()
+    payload = json.loads(text)
+    data = payload.get("data", {}) if isinstance(payload, dict) else None
+    if not isinstance(data, dict):
+        raise ValueError("Prefix response has no data object")
+    prefixes = PrefixSet()
+    for field in PREFIX_FIELDS:
+        for item in data.get(field) or []:
+            try:
+                prefixes.add(item["prefix"])
+            except (AttributeError, KeyError, TypeError, ValueError):
+                continue
+    return prefixes
+
+
+def fetch_announced_prefixes(
+    asn, session=None, api_url=API_URL, cache=None, scheduler=None
+):
+    """
+    Fetches announced IP prefixes for a given ASN from BGPView API.
+    Pass a shared session to reuse pooled keep-alive connections across calls,
+    a ResponseCache to serve repeated lookups from disk and a RequestScheduler
+    to rate-limit and retry requests.
+    Returns the IPv4 and IPv6 prefixes of the response as one PrefixSet, or None when
+    the lookup failed, so callers can tell it apart from an ASN with no prefixes.
+    """
+    url = api_url.format(asn=asn)
+    status = f"{WARNING_ORANGE}  [>] Fetching prefixes for ASN {asn}... {RESET}"
+    started = time.perf_counter()
+    res = prefixes = None
 
     try:
-        res = requests.get(url, headers=headers, timeout=20)
+        res = fetch_text(session, url, HEADERS, 20, cache, scheduler)
         if res.status_code != 200:
-            sys.stdout.write(f"{ALERT_RED}FAIL ({res.status_code}){RESET}\n")
-            return set()
-        sys.stdout.write(f"{SUCCESS_GREEN}SUCCESS{RESET}\n")
+            sys.stdout.write(f"{status}{ALERT_RED}FAIL ({res.status_code}){RESET}\n")
+            return None
+        with METRICS.timed("ipshin_parse_seconds", stage="prefixes"):
+            prefixes = parse_prefix_payload(res.text)
     except requests.exceptions.RequestException as e:
-        sys.stdout.write(f"{ALERT_RED}ERROR{RESET}\n")
-        print(f"{ALERT_RED}  [!] An error occurred: {e}{RESET}")
-        return set()
-
-    data = res.json()
-    prefixes = set()
-    for item in data.get("data", {}).get("ipv4_prefixes", []):
-        try:
-            prefixes.add(ipaddress.IPv4Network(item["prefix"]))
-        except (ipaddress.AddressValueError, ValueError):
-            continue
+        sys.stdout.write(
+            f"{status}{ALERT_RED}ERROR{RESET}\n"
+            f"{ALERT_RED}  [!] An error occurred: {e}{RESET}\n"
+        )
+        return None
+    except ValueError:
+        sys.stdout.write(f"{status}{ALERT_RED}FAIL (invalid JSON){RESET}\n")
+        return None
+    finally:
+        record_fetch("prefixes", started, res, prefixes, asn=asn)
+    source = " (cached)" if res.from_cache else ""
+    sys.stdout.write(f"{status}{SUCCESS_GREEN}SUCCESS{source}{RESET}\n")
+    sys.stdout.flush()
     return prefixes
 
 
-def remove_subnets(prefixes):
-    """Removes subnets, keeping only the supernets."""
+def fetch_prefixes_concurrently(
+    asns, workers=DEFAULT_WORKERS, api_url=API_URL, cache=None, scheduler=None, journal=None
+):
+    """
+    Fetches prefixes for many ASNs over one pooled session using a bounded thread pool.
+    Yields (asn, prefixes) pairs in completion order so callers can merge results as they arrive.
+    ASNs that fail are retried once more after the others have finished; prefixes is
+    None for ASNs that still failed.
+    With a Journal, ASNs it already holds are replayed from it without a request, and
+    every newly fetched ASN is checkpointed to it.
+    """
+    asns = list(dict.fromkeys(asns))
+    if journal is not None:
+        pending = []
+        for asn in asns:
+            if asn in journal.done:
+                yield asn, PrefixSet.from_text(journal.done[asn])
+            else:
+                pending.append(asn)
+        for asn, prefixes in fetch_prefixes_concurrently(
+            pending, workers, api_url, cache, scheduler
+        ):
+            if prefixes is not None:
+                journal.record(asn, prefixes.to_text().split())
+            yield asn, prefixes
+        return
+    workers = max(1, min(workers, len(asns) or 1))
+    scheduler = scheduler or RequestScheduler()
+    failed = []
+
+    def task(asn):
+        return asn, fetch_announced_prefixes(asn, session, api_url, cache, scheduler)
+
+    with create_session(workers, HEADERS) as session:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(task, asn) for asn in asns]
+            try:
+                for future in as_completed(futures):
+                    asn, prefixes = future.result()
+                    if prefixes is None:
+                        failed.append(asn)
+                    else:
+                        yield asn, prefixes
+            finally:
+                # On Ctrl+C or an abandoned generator, do not wait for the queued ASNs.
+                for future in futures:
+                    future.cancel()
+        if failed:
+            print(
+                f"{WARNING_ORANGE}  [>] Retrying {len(failed)} failed ASNs...{RESET}"
+            )
+        for asn in failed:
+            yield task(asn)
+
+
+def remove_subnets(prefixes, collapse=False, processes=1):
+    """
+    Removes subnets, keeping only the supernets.
+    With collapse=True adjacent siblings are merged as well, shrinking the list further.
+    IPv4 and IPv6 prefixes are cleaned separately; IPv4 comes first in the result.
+    processes other than 1 aggregates large sets in a process pool, 0 or None using every core.
+    """
     if not prefixes:
         return []
-    sorted_prefixes = sorted(list(prefixes), key=lambda x: x.prefixlen)
-    cleaned = []
-    for net in sorted_prefixes:
-        if not any(net.subnet_of(bigger_net) for bigger_net in cleaned):
-            cleaned.append(net)
-    cleaned.sort(key=lambda x: (x.prefixlen, int(x.network_address)))
+    if not isinstance(prefixes, PrefixSet):
+        prefixes = PrefixSet(prefixes)
+    with METRICS.timed("ipshin_stage_seconds", stage="aggregate"):
+        if processes == 1:
+            cleaned = list(prefixes.aggregated(collapse))
+        else:
+            cleaned = list(aggregate_prefixes(prefixes, collapse, processes))
+        cleaned.sort(key=network_sort_key)
+    METRICS.inc("ipshin_items_total", len(prefixes), stage="aggregate")
     return cleaned
 
 
-def save_to_txt(prefixes, filename):
-    """Saves a list of prefixes to a text file."""
+def select_family(prefixes, family):
+    """Keeps only the prefixes of family '4' or '6'; 'both' returns them all."""
+    if family == "both":
+        return list(prefixes)
+    version = int(family)
+    return [net for net in prefixes if net.version == version]
+
+
+def family_outputs(prefixes, family, out, out6=None):
+    """
+    Returns the (path, prefixes) pairs to write for a --family choice.
+    With 'both', IPv6 goes to out6 when given and is otherwise combined with IPv4 in out.
+    """
+    if family == "both" and out6:
+        return [(out, select_family(prefixes, "4")), (out6, select_family(prefixes, "6"))]
+    return [(out, select_family(prefixes, family))]
+
+
+def run_incremental(
+    asns,
+    state,
+    workers=DEFAULT_WORKERS,
+    cache=None,
+    api_url=API_URL,
+    scheduler=None,
+    journal=None,
+    collapse=False,
+):
+    """
+    Refetches only the stale ASNs in a PrefixState and rebuilds the cleaned list.
+    Returns (final_prefixes, added, removed, failed) relative to the previous run;
+    failed ASNs keep their previously saved prefixes. With collapse=True adjacent ranges
+    are merged before the diff, so added and removed patch the published list.
+    """
+    asns = list(dict.fromkeys(asns))
+    previous = [ipaddress.ip_network(p) for p in state.output]
+    stale = state.stale_asns(asns)
+    print(
+        f"{WARNING_ORANGE}  [>] {len(asns) - len(stale)} ASNs are up to date, refetching {len(stale)}.{RESET}"
+    )
+    failed = []
+    for asn, prefixes in fetch_prefixes_concurrently(
+        stale, workers, api_url, cache, scheduler, journal
+    ):
+        if prefixes is None:
+            failed.append(asn)
+        else:
+            state.update(asn, prefixes)
+    final_prefixes = state.aggregated(asns, collapse)
+    added, removed = diff_prefixes(previous, final_prefixes)
+    state.commit(asns, final_prefixes, collapse)
+    return final_prefixes, added, removed, failed
+
+
+def save_to_txt(prefixes, filename, fmt="txt", **options):
+    """
+    Saves a list of prefixes to a text file, or as rules in another export format.
+    The file is written in one buffered pass and atomically replaced; returns True on success.
+    """
     try:
-        with open(filename, "w") as f:
-            for p in prefixes:
-                f.write(str(p) + "\n")
+        export_prefixes(prefixes, filename, fmt, **options)
         print(
             f"\n{BOLD}{SUCCESS_GREEN} ┌────────────────────────────────────────────────────────────┐{RESET}"
         )
@@ -107,11 +405,438 @@ def save_to_txt(prefixes, filename):
         )
     except IOError as e:
         print(f"{ALERT_RED}  [✗ ERROR] Could not save file '{filename}': {e}{RESET}")
+        return False
+    return True
+
+
+# --- Command-Line Interface ---
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_PARTIAL = 3
+SUBCOMMANDS = ("fetch", "ingest", "export", "lookup", "query")
+
+
+def disable_colors():
+    """Blanks the ANSI style constants so status lines stay readable in logs."""
+    for name, value in list(globals().items()):
+        if name.isupper() and isinstance(value, str) and value.startswith("\033["):
+            globals()[name] = ""
+
+
+def read_asns(path):
+    """Reads whitespace-separated ASNs from a file, or from stdin when path is '-'."""
+    if path == "-":
+        content = sys.stdin.read()
+    else:
+        with open(path, "r") as f:
+            content = f.read()
+    return [asn for asn in content.split() if asn.isdigit()]
+
+
+def write_prefixes(prefixes, path, stream, fmt="txt", **options):
+    """Writes prefixes to path, or to stream when path is '-'; returns True on success."""
+    if path != "-":
+        return save_to_txt(prefixes, path, fmt, **options)
+    content = render(prefixes, fmt, **options)
+    if isinstance(content, bytes):
+        stream.buffer.write(content)
+    else:
+        stream.write(content)
+    stream.flush()
+    return True
+
+
+def write_annotated(asn_prefixes, path, collapse=False):
+    """
+    Writes the prefix-to-ASN table of {asn: prefixes} as CSV or Parquet; returns True on success.
+    collapse should match the main output, so the range column names its prefixes.
+    """
+    table = AnnotatedPrefixes.from_asn_map(asn_prefixes)
+    try:
+        table.write(path, collapse)
+    except (OSError, ValueError) as e:
+        print(f"{ALERT_RED}  [✗ ERROR] Could not save file '{path}': {e}{RESET}")
+        return False
+    print(f"{MEDIUM_GRAY}  [i] {len(table)} prefix-ASN rows saved to '{path}'.{RESET}")
+    return True
+
+
+def add_export_arguments(parser):
+    parser.add_argument("--format", choices=FORMATS, default="txt", help="output format")
+    parser.add_argument("--policy", default=DEFAULT_POLICY, help="surge rule policy")
+    parser.add_argument("--final", default=DEFAULT_FINAL, help="surge FINAL policy")
+    parser.add_argument("--set-name", default=DEFAULT_SET_NAME, help="nftables/ipset set name")
+
+
+def export_options(args):
+    return {"policy": args.policy, "final": args.final, "set_name": args.set_name}
+
+
+def add_family_arguments(parser):
+    parser.add_argument("--family", choices=FAMILIES, default="4", help="address family to write")
+    parser.add_argument("--out6", help="with --family both, write IPv6 here instead of into --out")
+
+
+def write_family_outputs(prefixes, args, out):
+    """Writes the cleaned prefixes per --family/--out6; returns True if every write succeeded."""
+    return all(
+        [
+            write_prefixes(selected, path, out, args.format, **export_options(args))
+            for path, selected in family_outputs(prefixes, args.family, args.out, args.out6)
+        ]
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="ipfinder",
+        description="Fetch announced IP prefixes for ASNs. Run without arguments for the interactive menu.",
+    )
+    commands = parser.add_subparsers(dest="command")
+
+    fetch = commands.add_parser("fetch", help="fetch and clean prefixes for a list of ASNs (default)")
+    fetch.add_argument("--asn", nargs="+", default=[], help="ASNs to fetch")
+    fetch.add_argument("--asn-file", help="file with one ASN per line, '-' for stdin")
+    fetch.add_argument("--out", default="IPFinder(Log).txt", help="output file, '-' for stdout")
+    fetch.add_argument("--workers", type=positive_int, default=DEFAULT_WORKERS)
+    fetch.add_argument("--collapse", action="store_true", help="also merge adjacent ranges")
+    fetch.add_argument("--api-url", default=API_URL, help="prefix API URL template with an {asn} field")
+    fetch.add_argument("--cache-mode", choices=CACHE_MODES, default=DEFAULT_MODE)
+    fetch.add_argument("--incremental", action="store_true", help="refetch only stale ASNs")
+    fetch.add_argument("--state", default=DEFAULT_STATE_PATH, help="incremental state file")
+    fetch.add_argument("--added", help="with --incremental, write added prefixes here")
+    fetch.add_argument("--removed", help="with --incremental, write removed prefixes here")
+    fetch.add_argument("--annotated", help="also write each prefix with its ASNs here, as CSV or *.parquet")
+    fetch.add_argument("--quiet", action="store_true", help="suppress progress messages")
+    add_family_arguments(fetch)
+    add_scheduler_arguments(fetch)
+    add_journal_arguments(fetch)
+    add_export_arguments(fetch)
+    add_process_arguments(fetch)
+    add_metrics_arguments(fetch)
+
+    bulk = commands.add_parser("ingest", help="build the prefix list from local bulk datasets, without the network")
+    bulk.add_argument("--pfx2as", action="append", default=[], help="pfx2as / RouteViews prefix-to-AS file (repeatable)")
+    bulk.add_argument("--mrt", action="append", default=[], help="MRT TABLE_DUMP_V2 RIB file (repeatable)")
+    bulk.add_argument("--delegated", action="append", default=[], help="RIR delegated-stats file (repeatable)")
+    bulk.add_argument("--country", nargs="+", help="keep ASNs registered to these countries in the delegated files")
+    bulk.add_argument("--asn", nargs="+", default=[], help="keep only these ASNs")
+    bulk.add_argument("--asn-file", help="file with ASNs to keep, '-' for stdin")
+    bulk.add_argument("--out", default="IPFinder(Log).txt", help="output file, '-' for stdout")
+    bulk.add_argument("--asn-out", help="also write the selected ASNs here")
+    bulk.add_argument("--state", help="also store the ASN-to-prefix mapping here, for lookup --state")
+    bulk.add_argument("--annotated", help="also write each prefix with its ASNs here, as CSV or *.parquet")
+    bulk.add_argument("--collapse", action="store_true", help="also merge adjacent ranges")
+    bulk.add_argument("--quiet", action="store_true", help="suppress progress messages")
+    add_family_arguments(bulk)
+    add_export_arguments(bulk)
+    add_process_arguments(bulk)
+    add_metrics_arguments(bulk)
+
+    export = commands.add_parser("export", help="render a prefix list as proxy or firewall rules")
+    export.add_argument("--prefixes", required=True, help="prefix list such as IPFinder(Log).txt, '-' for stdin")
+    export.add_argument("--out", required=True, help="output file, '-' for stdout")
+    export.add_argument("--collapse", action="store_true", help="merge adjacent ranges to cut the rule count")
+    export.add_argument("--quiet", action="store_true", help="suppress progress messages")
+    add_export_arguments(export)
+    add_process_arguments(export)
+    add_metrics_arguments(export)
+
+    lookup = commands.add_parser("lookup", help="check IP addresses against a prefix list")
+    lookup.add_argument("ips", nargs="*", help="IP addresses to look up")
+    lookup.add_argument("--ip-file", help="file with one IP per line, '-' for stdin")
+    source = lookup.add_mutually_exclusive_group(required=True)
+    source.add_argument("--prefixes", help="prefix list such as IPFinder(Log).txt")
+    source.add_argument("--state", help="incremental state file, which also knows each prefix's ASN")
+    source.add_argument("--index", help="prebuilt index from --save-index")
+    lookup.add_argument("--save-index", help="write the built index here for fast reloading")
+    lookup.add_argument("--asn", action="store_true", help="also print the owning ASN")
+    lookup.add_argument("--quiet", action="store_true", help="suppress progress messages")
+
+    query = commands.add_parser("query", help="show which prefixes an ASN announces and which ASNs cover an IP")
+    query.add_argument("--asn", nargs="+", type=int, default=[], help="list the prefixes these ASNs announce")
+    query.add_argument("--ip", nargs="+", default=[], help="list every announced prefix covering these addresses, with its ASNs")
+    source = query.add_mutually_exclusive_group(required=True)
+    source.add_argument("--annotated", help="prefix-to-ASN table written by fetch or ingest --annotated")
+    source.add_argument("--state", help="incremental or ingest state file")
+    query.add_argument("--quiet", action="store_true", help="suppress progress messages")
+    return parser
+
+
+def command_fetch(args, out):
+    asns = list(args.asn)
+    if args.asn_file:
+        asns.extend(read_asns(args.asn_file))
+    asns = list(dict.fromkeys(asns))
+    if not asns:
+        print(f"{ALERT_RED}  [!] No ASNs given.{RESET}")
+        return EXIT_ERROR
+
+    try:
+        journal = journal_from_args(args, "ipfinder")
+    except ValueError as e:
+        print(f"{ALERT_RED}  [!] Cannot resume: {e}{RESET}")
+        return EXIT_ERROR
+    if journal is not None and journal.done:
+        print(f"{MEDIUM_GRAY}  [i] Resuming: {len(journal.done)} ASNs already fetched.{RESET}")
+
+    scheduler = scheduler_from_args(args)
+    with ResponseCache(mode=args.cache_mode) as cache, contextlib.ExitStack() as stack:
+        if journal is not None:
+            stack.enter_context(journal)
+        asn_prefixes = {}
+        if args.incremental:
+            state = PrefixState(args.state)
+            final_prefixes, added, removed, failed = run_incremental(
+                asns,
+                state,
+                args.workers,
+                cache,
+                args.api_url,
+                scheduler,
+                journal,
+                args.collapse,
+            )
+            if args.added:
+                write_prefixes(select_family(added, args.family), args.added, out)
+            if args.removed:
+                write_prefixes(select_family(removed, args.family), args.removed, out)
+            if args.annotated:
+                asn_prefixes = {asn: state.asns[asn]["prefixes"] for asn in asns if asn in state.asns}
+        else:
+            session_prefixes = PrefixSet()
+            failed = []
+            for asn, prefixes in fetch_prefixes_concurrently(
+                asns, args.workers, args.api_url, cache, scheduler, journal
+            ):
+                if prefixes is None:
+                    failed.append(asn)
+                    continue
+                session_prefixes.update(prefixes)
+                if args.annotated:
+                    asn_prefixes[asn] = prefixes
+            final_prefixes = remove_subnets(session_prefixes, args.collapse, args.processes)
+        print(f"{MEDIUM_GRAY}  [i] Response cache: {cache.summary()}{RESET}")
+
+    if not write_family_outputs(final_prefixes, args, out):
+        return EXIT_ERROR
+    if args.annotated and not write_annotated(asn_prefixes, args.annotated, args.collapse):
+        return EXIT_ERROR
+    if failed:
+        print(
+            f"{ALERT_RED}  [!] {len(failed)} of {len(asns)} ASNs failed: {' '.join(sorted(failed, key=int))}{RESET}"
+        )
+        if journal is not None:
+            print(f"{MEDIUM_GRAY}  [i] Retry only the failed ASNs with --resume '{journal.path}'.{RESET}")
+        return EXIT_PARTIAL
+    if journal is not None:
+        journal.discard()
+    return EXIT_OK
+
+
+def command_ingest(args, out):
+    if not (args.pfx2as or args.mrt or args.delegated):
+        print(f"{ALERT_RED}  [!] Give at least one --pfx2as, --mrt or --delegated file.{RESET}")
+        return EXIT_ERROR
+    if args.country and not args.delegated:
+        print(f"{ALERT_RED}  [!] --country needs a --delegated file to know each country's ASNs.{RESET}")
+        return EXIT_ERROR
+
+    asns = list(args.asn)
+    if args.asn_file:
+        asns.extend(read_asns(args.asn_file))
+    selected = dict.fromkeys(asns) if asns else None
+    registered = {}
+    delegated_prefixes = {}
+    for path in args.delegated:
+        with open_dataset(path) as f:
+            country_asns, holder_prefixes = read_delegated(f, args.country)
+        print(f"{MEDIUM_GRAY}  [i] {path}: {len(country_asns)} ASNs registered.{RESET}")
+        registered.update(dict.fromkeys(country_asns))
+        delegated_prefixes.update(holder_prefixes)
+    if args.country:
+        selected = {asn: None for asn in registered if selected is None or asn in selected}
+
+    if args.pfx2as or args.mrt:
+        asn_prefixes = ingest(args.pfx2as, args.mrt, selected)
+    else:
+        asn_prefixes = {
+            asn: prefixes
+            for asn, prefixes in delegated_prefixes.items()
+            if selected is None or asn in selected
+        }
+    print(f"{MEDIUM_GRAY}  [i] {len(asn_prefixes)} ASNs with prefixes.{RESET}")
+
+    session_prefixes = PrefixSet()
+    for prefixes in asn_prefixes.values():
+        session_prefixes.update(prefixes)
+    final_prefixes = remove_subnets(session_prefixes, args.collapse, args.processes)
+    if args.asn_out:
+        with open(args.asn_out, "w") as f:
+            f.write("".join(f"{asn}\n" for asn in sorted(selected or asn_prefixes, key=int)))
+    if args.state:
+        state = PrefixState(args.state)
+        for asn, prefixes in asn_prefixes.items():
+            state.update(asn, prefixes)
+        state.commit(asn_prefixes, final_prefixes, args.collapse)
+    if not write_family_outputs(final_prefixes, args, out):
+        return EXIT_ERROR
+    if args.annotated and not write_annotated(asn_prefixes, args.annotated, args.collapse):
+        return EXIT_ERROR
+    return EXIT_OK
+
+
+def read_prefix_list(f, processes=1):
+    """
+    Reads a CIDR list, skipping malformed lines with a warning; with processes other than 1
+    it is read whole and parsed in a process pool.
+    """
+    skipped = []
+    if processes == 1:
+        prefixes = PrefixSet.from_text(f, skipped)
+    else:
+        prefixes = parse_prefix_text(f.read(), processes, skipped)
+    if skipped:
+        print(
+            f"{WARNING_ORANGE}  [!] Skipped {len(skipped)} malformed lines, the first being '{skipped[0]}'.{RESET}"
+        )
+    return prefixes
+
+
+def command_export(args, out):
+    if args.prefixes == "-":
+        prefixes = read_prefix_list(sys.stdin, args.processes)
+    else:
+        with open(args.prefixes, "r") as f:
+            prefixes = read_prefix_list(f, args.processes)
+    if args.collapse:
+        prefixes = aggregate_prefixes(prefixes, True, args.processes)
+    if not write_prefixes(prefixes, args.out, out, args.format, **export_options(args)):
+        return EXIT_ERROR
+    return EXIT_OK
+
+
+def command_lookup(args, out):
+    if args.index:
+        index = LookupIndex.load(args.index)
+    elif args.state:
+        index = LookupIndex.from_asn_map(
+            {asn: entry["prefixes"] for asn, entry in PrefixState(args.state).asns.items()}
+        )
+    else:
+        with open(args.prefixes, "r") as f:
+            index = LookupIndex.from_prefixes(PrefixSet.from_text(f))
+    print(f"{MEDIUM_GRAY}  [i] Index holds {len(index)} ranges.{RESET}")
+    if args.save_index:
+        index.save(args.save_index)
+        print(f"{SUCCESS_GREEN}  [✓] Index saved to '{args.save_index}'.{RESET}")
+
+    sources = [args.ips]
+    if args.ip_file:
+        sources.append(sys.stdin if args.ip_file == "-" else open(args.ip_file, "r"))
+    batch = []
+    for source in sources:
+        for ip, owner in index.lookup_many(source):
+            if owner is INVALID:
+                batch.append(f"{ip}\tinvalid\n")
+            elif owner is None:
+                batch.append(f"{ip}\tno\n")
+            elif args.asn:
+                batch.append(f"{ip}\tyes\t{owner or '-'}\n")
+            else:
+                batch.append(f"{ip}\tyes\n")
+            if len(batch) >= 65536:
+                out.write("".join(batch))
+                batch = []
+        if source not in (args.ips, sys.stdin):
+            source.close()
+    out.write("".join(batch))
+    out.flush()
+    return EXIT_OK
+
+
+def command_query(args, out):
+    try:
+        if args.annotated:
+            table = AnnotatedPrefixes.load(args.annotated)
+        else:
+            table = AnnotatedPrefixes.from_asn_map(
+                {asn: entry["prefixes"] for asn, entry in PrefixState(args.state).asns.items()}
+            )
+    except ValueError as e:
+        print(f"{ALERT_RED}  [!] {e}{RESET}")
+        return EXIT_ERROR
+    print(f"{MEDIUM_GRAY}  [i] Table holds {len(table)} prefix-ASN rows.{RESET}")
+
+    lines = []
+    for asn in args.asn:
+        lines.extend(f"{asn}\t{prefix}\n" for prefix in table.prefixes_for(asn))
+    for ip in args.ip:
+        try:
+            covering = table.covering(ip)
+        except ValueError as e:
+            print(f"{ALERT_RED}  [!] {e}{RESET}")
+            continue
+        if not covering:
+            lines.append(f"{ip}\t-\n")
+        lines.extend(f"{ip}\t{prefix}\t{','.join(map(str, asns))}\n" for prefix, asns in covering)
+    out.write("".join(lines))
+    out.flush()
+    return EXIT_OK
+
+
+COMMANDS = {
+    "fetch": command_fetch,
+    "ingest": command_ingest,
+    "export": command_export,
+    "lookup": command_lookup,
+    "query": command_query,
+}
+
+
+def run_cli(argv):
+    """Runs one non-interactive command and returns its exit code."""
+    if argv[0] not in SUBCOMMANDS and argv[0] not in ("-h", "--help"):
+        argv = ["fetch"] + list(argv)
+    args = build_parser().parse_args(argv)
+    out = sys.stdout
+    if not sys.stderr.isatty():
+        disable_colors()
+    with contextlib.ExitStack() as stack:
+        status = stack.enter_context(open(os.devnull, "w")) if args.quiet else sys.stderr
+        stack.enter_context(contextlib.redirect_stdout(status))
+        stack.enter_context(instrumented(args))
+        try:
+            return COMMANDS[args.command](args, out)
+        except KeyboardInterrupt:
+            return 130
+        except (OSError, ValueError, EOFError) as e:
+            sys.stderr.write(f"ipfinder: {e or type(e).__name__}\n")
+            return EXIT_ERROR
 
 
 # --- Main Menu and Logic ---
-def main():
-    session_prefixes = set()
+def save_session(final_prefixes, asn_prefixes=None):
+    """
+    Saves IPv4 to IPFinder(Log).txt and, if any were found, IPv6 to IPFinder(Log6).txt,
+    plus each prefix with its ASNs to IPFinder(ASNs).csv.
+    """
+    save_to_txt(select_family(final_prefixes, "4"), "IPFinder(Log).txt")
+    ipv6 = select_family(final_prefixes, "6")
+    if ipv6:
+        save_to_txt(ipv6, "IPFinder(Log6).txt")
+    if asn_prefixes:
+        write_annotated(asn_prefixes, "IPFinder(ASNs).csv")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        sys.exit(run_cli(argv))
+
+    session_prefixes = PrefixSet()
+    session_asns = {}
+    cache = ResponseCache()
 
     while True:
         print(
@@ -141,6 +866,12 @@ def main():
         print(
             f"{BOLD}{DEEP_PURPLE} ║                                                 ║{RESET}"
         )
+        print(
+            f"{BOLD}{DEEP_PURPLE} ║ {RESET}{BOLD}{ORANGE}[{RESET}{BOLD}{VIBRANT_PURPLE}4{RESET}{BOLD}{ORANGE}]{RESET} {VIBRANT_PURPLE}Incremental Update From File                {RESET}{BOLD}{DEEP_PURPLE}║{RESET}"
+        )
+        print(
+            f"{BOLD}{DEEP_PURPLE} ║                                                 ║{RESET}"
+        )
         print(
             f"{BOLD}{DEEP_PURPLE} ║ {RESET}{BOLD}{ORANGE}[{RESET}{BOLD}{ALERT_RED}E{RESET}{BOLD}{ORANGE}]{RESET} {BOLD}{ALERT_RED}Exit                                        {RESET}{BOLD}{DEEP_PURPLE}║{RESET}"
         )
@@ -197,6 +928,31 @@ def main():
                 print(f"{ALERT_RED}  [!] File not found.{RESET}")
                 time.sleep(1.5)
                 continue
+        elif user_choice == "4":
+            filepath = input(
+                f"{BRIGHT_WHITE}[{RESET}{PROMPT_MAGENTA}~{RESET}{BRIGHT_WHITE}]{RESET}{BOLD}{PROMPT_MAGENTA} Enter the path to your text file: {RESET}"
+            ).strip()
+            if not os.path.exists(filepath):
+                print(f"{ALERT_RED}  [!] File not found.{RESET}")
+                time.sleep(1.5)
+                continue
+            with open(filepath, "r") as f:
+                asn_list = [asn for asn in f.read().split() if asn.isdigit()]
+            print(f"\n{BOLD}{LIGHT_PURPLE}--- Initiating Incremental Update ---{RESET}")
+            state = PrefixState()
+            final_prefixes, added, removed, _ = run_incremental(
+                asn_list, state, DEFAULT_WORKERS, cache
+            )
+            print(f"\n{BOLD}{LIGHT_PURPLE}--- Update Summary ---{RESET}")
+            print(f"{SUCCESS_GREEN}  [+] {len(added)} prefixes added.{RESET}")
+            print(f"{ALERT_RED}  [-] {len(removed)} prefixes removed.{RESET}")
+            save_session(
+                final_prefixes,
+                {asn: state.asns[asn]["prefixes"] for asn in asn_list if asn in state.asns},
+            )
+            save_to_txt(added, "IPFinder(Added).txt")
+            save_to_txt(removed, "IPFinder(Removed).txt")
+            continue
         else:
             print(f"{ALERT_RED}  [!] Invalid selection.{RESET}")
             time.sleep(1.5)
@@ -205,9 +961,18 @@ def main():
         if asn_list:
             print(f"\n{BOLD}{LIGHT_PURPLE}--- Initiating Prefix Collection ---{RESET}")
             old_count = len(session_prefixes)
-            for asn in asn_list:
-                session_prefixes.update(fetch_announced_prefixes(asn))
-                time.sleep(0.1)
+            try:
+                for asn, prefixes in fetch_prefixes_concurrently(
+                    asn_list, DEFAULT_WORKERS, cache=cache
+                ):
+                    if prefixes:
+                        session_prefixes.update(prefixes)
+                        session_asns.setdefault(asn, PrefixSet()).update(prefixes)
+            except KeyboardInterrupt:
+                print(
+                    f"\n{ALERT_RED}  [!] Scan interrupted (Ctrl+C). Saving the prefixes collected so far.{RESET}"
+                )
+                break
 
             newly_added_count = len(session_prefixes) - old_count
             print(f"\n{BOLD}{LIGHT_PURPLE}--- Collection Summary ---{RESET}")
@@ -217,6 +982,7 @@ def main():
             print(
                 f"{WARNING_ORANGE}  [>] Total unique prefixes in session: {len(session_prefixes)}{RESET}"
             )
+            print(f"{MEDIUM_GRAY}  [i] Response cache: {cache.summary()}{RESET}")
 
             loading_animation("Processing collected data ", 1)
 
@@ -237,7 +1003,7 @@ def main():
             f"Cleaning all {len(session_prefixes)} collected prefixes ", 2
         )
         final_prefixes = remove_subnets(session_prefixes)
-        save_to_txt(final_prefixes, "IPFinder(Log).txt")
+        save_session(final_prefixes, session_asns)
     else:
         print(
             f"\n{WARNING_ORANGE}[INFO] No prefixes were collected. Nothing to save.{RESET}"
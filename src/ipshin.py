@@ -0,0 +1,173 @@
+import argparse
+import contextlib
+import os
+import signal
+import sys
+
+import asnfinder
+import ipfinder
+from asnfinder import DEFAULT_COUNTRY, DEFAULT_MAX_PAGES, page_range_arg
+from cache import CACHE_MODES, DEFAULT_MODE, DEFAULT_TTL, ResponseCache
+from httpclient import add_scheduler_arguments, positive_int, scheduler_from_args
+from metrics import add_metrics_arguments, instrumented
+from pipeline import (
+    DEFAULT_FETCH_WORKERS,
+    DEFAULT_PAGE_WORKERS,
+    DEFAULT_QUEUE_SIZE,
+    run_pipeline,
+)
+from server import DEFAULT_HOST, DEFAULT_INTERVAL, DEFAULT_PORT, PrefixService, ServiceServer
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_PARTIAL = 3
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="ipshin", description="Ipshin network analysis toolkit."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pipeline = commands.add_parser(
+        "pipeline", help="scrape a country's ASNs and fetch their prefixes in one streaming run"
+    )
+    pipeline.add_argument("--country", nargs="+", default=[DEFAULT_COUNTRY], help="ISO country codes")
+    pipeline.add_argument("--pages", type=page_range_arg, help="page or range, e.g. 1-50 (default: every page)")
+    pipeline.add_argument("--max-pages", type=positive_int, help=f"stop automatic pagination after this page (default: {DEFAULT_MAX_PAGES})")
+    pipeline.add_argument("--out", default="IPFinder(Log).txt", help="output file, '-' for stdout")
+    pipeline.add_argument("--asn-out", help="also write the discovered ASNs here")
+    pipeline.add_argument("--page-workers", type=positive_int, default=DEFAULT_PAGE_WORKERS)
+    pipeline.add_argument("--workers", type=positive_int, default=DEFAULT_FETCH_WORKERS)
+    pipeline.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="ASNs buffered between stages")
+    pipeline.add_argument("--collapse", action="store_true", help="also merge adjacent ranges")
+    pipeline.add_argument("--cache-mode", choices=CACHE_MODES, default=DEFAULT_MODE)
+    pipeline.add_argument("--report-url", default=asnfinder.REPORT_URL, help="country report URL template")
+    pipeline.add_argument("--api-url", default=ipfinder.API_URL, help="prefix API URL template")
+    pipeline.add_argument("--quiet", action="store_true", help="suppress progress messages")
+    ipfinder.add_family_arguments(pipeline)
+    add_scheduler_arguments(pipeline)
+    ipfinder.add_export_arguments(pipeline)
+    add_metrics_arguments(pipeline)
+
+    serve = commands.add_parser(
+        "serve", help="keep the prefix list fresh in the background and serve it over HTTP"
+    )
+    serve.add_argument("--host", default=DEFAULT_HOST, help="address to listen on")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="seconds between refreshes")
+    serve.add_argument("--asn", nargs="+", default=[], help="serve these ASNs instead of scanning countries")
+    serve.add_argument("--asn-file", help="file of ASNs to serve instead of scanning countries")
+    serve.add_argument("--country", nargs="+", default=[DEFAULT_COUNTRY], help="ISO country codes")
+    serve.add_argument("--pages", type=page_range_arg, help="page or range, e.g. 1-50 (default: every page)")
+    serve.add_argument("--max-pages", type=positive_int, help=f"stop automatic pagination after this page (default: {DEFAULT_MAX_PAGES})")
+    serve.add_argument("--page-workers", type=positive_int, default=DEFAULT_PAGE_WORKERS)
+    serve.add_argument("--workers", type=positive_int, default=DEFAULT_FETCH_WORKERS)
+    serve.add_argument("--collapse", action="store_true", help="also merge adjacent ranges")
+    serve.add_argument("--cache-mode", choices=CACHE_MODES, default=DEFAULT_MODE)
+    serve.add_argument("--report-url", default=asnfinder.REPORT_URL, help="country report URL template")
+    serve.add_argument("--api-url", default=ipfinder.API_URL, help="prefix API URL template")
+    serve.add_argument("--family", choices=ipfinder.FAMILIES, default="4", help="default family for /rules")
+    serve.add_argument("--quiet", action="store_true", help="suppress progress messages and the access log")
+    add_scheduler_arguments(serve)
+    ipfinder.add_export_arguments(serve)
+    add_metrics_arguments(serve)
+    return parser
+
+
+def command_pipeline(args, out):
+    with ResponseCache(mode=args.cache_mode) as cache:
+        final_prefixes, asns, failed_pages, failed_asns = run_pipeline(
+            args.pages,
+            list(dict.fromkeys(country.upper() for country in args.country)),
+            args.page_workers,
+            args.workers,
+            args.queue_size,
+            cache,
+            args.collapse,
+            args.report_url,
+            args.api_url,
+            page_scheduler=scheduler_from_args(args),
+            api_scheduler=scheduler_from_args(args),
+            max_pages=args.max_pages,
+        )
+        print(f"  [i] Response cache: {cache.summary()}")
+
+    if args.asn_out:
+        with open(args.asn_out, "w") as f:
+            f.write("".join(f"{asn}\n" for asn in sorted(asns, key=int)))
+    if not ipfinder.write_family_outputs(final_prefixes, args, out):
+        return EXIT_ERROR
+    print(f"  [i] {len(asns)} ASNs, {len(final_prefixes)} prefixes.")
+    if failed_pages or failed_asns:
+        print(
+            f"  [!] {len(failed_pages)} pages and {len(failed_asns)} ASNs could not be fetched."
+        )
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+
+def command_serve(args, out):
+    countries = list(dict.fromkeys(country.upper() for country in args.country))
+    explicit = list(args.asn)
+    if args.asn_file:
+        explicit.extend(ipfinder.read_asns(args.asn_file))
+    explicit = list(dict.fromkeys(explicit))
+
+    # Entries must go stale between refreshes, so each refresh revalidates them instead of replaying them.
+    with ResponseCache(ttl=min(DEFAULT_TTL, args.interval / 2), mode=args.cache_mode) as cache:
+        scheduler = scheduler_from_args(args)
+
+        def list_asns():
+            if explicit:
+                return explicit
+            results = asnfinder.scan_countries(
+                countries, args.pages, args.page_workers, args.report_url, cache, scheduler, args.max_pages
+            )
+            return list(dict.fromkeys(asn for asns, _ in results.values() for asn in asns))
+
+        service = PrefixService(
+            list_asns, args.interval, args.collapse, args.workers, args.api_url, cache, scheduler_from_args(args)
+        )
+        server = ServiceServer(
+            (args.host, args.port), service, args.format, args.family, ipfinder.export_options(args)
+        )
+        # Daemons are stopped with SIGTERM; shut down the same way as on Ctrl+C.
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            service.start()
+            print(f"  [i] Serving on http://{args.host}:{server.server_address[1]}/ (Ctrl+C to stop)")
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("  [i] Stopping.")
+        finally:
+            service.stop()
+            server.server_close()
+    return EXIT_OK
+
+
+COMMANDS = {"pipeline": command_pipeline, "serve": command_serve}
+
+
+def main(argv=None):
+    args = build_parser().parse_args(sys.argv[1:] if argv is None else argv)
+    out = sys.stdout
+    if not sys.stderr.isatty():
+        asnfinder.disable_colors()
+        ipfinder.disable_colors()
+    with contextlib.ExitStack() as stack:
+        status = stack.enter_context(open(os.devnull, "w")) if args.quiet else sys.stderr
+        stack.enter_context(contextlib.redirect_stdout(status))
+        stack.enter_context(instrumented(args))
+        try:
+            code = COMMANDS[args.command](args, out)
+        except KeyboardInterrupt:
+            code = 130
+        except (OSError, ValueError, EOFError) as e:
+            sys.stderr.write(f"ipshin: {e or type(e).__name__}\n")
+            code = EXIT_ERROR
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import json
+import os
+import time
+
+# --- Journal Configuration ---
+JOURNAL_VERSION = 1
+FLUSH_INTERVAL = 1.0
+
+
+class Journal:
+    """
+    Append-only checkpoint of finished work units, one JSON line each, so that an
+    interrupted run can skip them when resumed. The first line names the kind of work.
+    Lines are buffered and flushed at most every FLUSH_INTERVAL seconds and on close,
+    so a checkpoint costs one json.dumps and a buffered write; a crash loses at most
+    the last interval. A last line torn by a crash is dropped when the journal is resumed.
+    """
+
+    def __init__(self, path, kind, resume=False, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.kind = kind
+        self.flush_interval = flush_interval
+        self.done = {}
+        if resume and os.path.exists(path):
+            self._load()
+            self._file = open(path, "a")
+        else:
+            self._file = open(path, "w")
+            self._file.write(json.dumps({"journal": kind, "version": JOURNAL_VERSION}) + "\n")
+        self._flushed = time.monotonic()
+
+    def _load(self):
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+        lines = data[:end].decode("utf-8").splitlines()
+        header = json.loads(lines[0]) if lines else {}
+        if header.get("journal") != self.kind:
+            raise ValueError(f"'{self.path}' is not a {self.kind} journal")
+        for line in lines[1:]:
+            entry = json.loads(line)
+            self.done[entry["key"]] = entry["value"]
+
+    def record(self, key, value):
+        """Checkpoints one finished unit of work; value must be JSON-serialisable."""
+        self.done[key] = value
+        self._file.write(json.dumps({"key": key, "value": value}, separators=(",", ":")) + "\n")
+        now = time.monotonic()
+        if now - self._flushed >= self.flush_interval:
+            self._file.flush()
+            self._flushed = now
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def discard(self):
+        """Closes and deletes the journal once its run has finished cleanly."""
+        self.close()
+        os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# --- Command-Line Hooks ---
+def add_journal_arguments(parser):
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--journal", help="checkpoint finished work to this file, removed after a complete run")
+    group.add_argument("--resume", metavar="JOURNAL", help="skip the work a previous run checkpointed here, and keep checkpointing")
+
+
+def journal_from_args(args, kind):
+    """Opens the journal named by --journal or --resume, or returns None."""
+    if args.resume:
+        return Journal(args.resume, kind, resume=True)
+    if args.journal:
+        return Journal(args.journal, kind)
+    return None
@@ -0,0 +1,230 @@
+import bisect
+import socket
+import struct
+import sys
+from array import array
+
+from prefixset import PrefixSet
+
+# --- Index Format ---
+# magic, IPv4 and IPv6 entry counts, then three little-endian uint32 arrays for IPv4
+# (starts, ends, owner ASNs), the IPv6 starts and ends as 16-byte big-endian integers
+# and a little-endian uint32 array of IPv6 owner ASNs.
+INDEX_MAGIC = b"IPSHLKP2"
+INDEX_HEADER = struct.Struct("<II")
+IPV6_WIDTH = 16
+NO_ASN = 0
+# Owner yielded by lookup_many for a line that is not an IP address.
+INVALID = object()
+
+
+def parse_ipv4(text):
+    """Converts a dotted-quad string to an integer, raising ValueError on anything else."""
+    text = text.strip()
+    if text.count(".") != 3:
+        raise ValueError(f"Invalid IPv4 address '{text}'")
+    try:
+        return int.from_bytes(socket.inet_aton(text), "big")
+    except OSError:
+        raise ValueError(f"Invalid IPv4 address '{text}'") from None
+
+
+def parse_ip(text):
+    """Converts an IPv4 or IPv6 address string to (version, integer), raising ValueError on anything else."""
+    text = text.strip()
+    if ":" not in text:
+        return 4, parse_ipv4(text)
+    try:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, text), "big")
+    except OSError:
+        raise ValueError(f"Invalid IPv6 address '{text}'") from None
+
+
+def flatten(items):
+    """
+    Turns (start, end, asn) ranges, which may nest, into disjoint segments where the most
+    specific range owns each address. Touching segments with the same owner are merged.
+    """
+    items = sorted(items, key=lambda r: (r[0], -r[1]))
+    segments = []
+
+    def emit(start, end, asn):
+        if segments and segments[-1][1] + 1 == start and segments[-1][2] == asn:
+            segments[-1] = (segments[-1][0], end, asn)
+        else:
+            segments.append((start, end, asn))
+
+    stack = []
+    cursor = 0
+    for start, end, asn in items:
+        while stack and stack[-1][0] < start:
+            top_end, top_asn = stack.pop()
+            if cursor <= top_end:
+                emit(cursor, top_end, top_asn)
+                cursor = top_end + 1
+        if stack and cursor < start:
+            emit(cursor, start - 1, stack[-1][1])
+        stack.append((end, asn))
+        cursor = start
+    while stack:
+        top_end, top_asn = stack.pop()
+        if cursor <= top_end:
+            emit(cursor, top_end, top_asn)
+            cursor = top_end + 1
+    return segments
+
+
+class LookupIndex:
+    """
+    Sorted, disjoint intervals answering membership and owner-ASN queries with one binary
+    search per address. IPv4 intervals live in uint32 arrays; IPv6 intervals need 128 bits
+    and are kept as sorted lists of integers next to a uint32 array of owners.
+    """
+
+    def __init__(self, starts, ends, asns, starts6=None, ends6=None, asns6=None):
+        self.starts = starts
+        self.ends = ends
+        self.asns = asns
+        self.starts6 = starts6 if starts6 is not None else []
+        self.ends6 = ends6 if ends6 is not None else []
+        self.asns6 = asns6 if asns6 is not None else array("I")
+
+    # --- Building ---
+    @classmethod
+    def from_segments(cls, segments, segments6=()):
+        starts, ends, asns = array("I"), array("I"), array("I")
+        for start, end, asn in segments:
+            starts.append(start)
+            ends.append(end)
+            asns.append(asn)
+        starts6, ends6, asns6 = [], [], array("I")
+        for start, end, asn in segments6:
+            starts6.append(start)
+            ends6.append(end)
+            asns6.append(asn)
+        return cls(starts, ends, asns, starts6, ends6, asns6)
+
+    @classmethod
+    def from_prefixes(cls, prefixes):
+        """Builds an index from any prefixes, without owner information."""
+        if not isinstance(prefixes, PrefixSet):
+            prefixes = PrefixSet(prefixes)
+        return cls.from_segments(
+            *(
+                flatten((start, end, NO_ASN) for start, end in prefixes.ranges(version))
+                for version in (4, 6)
+            )
+        )
+
+    @classmethod
+    def from_asn_map(cls, asn_prefixes):
+        """Builds an index from {asn: prefixes}; the most specific announcement owns an address."""
+        items = {4: [], 6: []}
+        for asn, prefixes in asn_prefixes.items():
+            if not isinstance(prefixes, PrefixSet):
+                prefixes = PrefixSet(prefixes)
+            for version, family_items in items.items():
+                family_items.extend(
+                    (start, end, int(asn)) for start, end in prefixes.ranges(version)
+                )
+        return cls.from_segments(flatten(items[4]), flatten(items[6]))
+
+    # --- Queries ---
+    def __len__(self):
+        return len(self.starts) + len(self.starts6)
+
+    def _columns(self, version):
+        if version == 4:
+            return self.starts, self.ends, self.asns
+        return self.starts6, self.ends6, self.asns6
+
+    def find(self, address, version=4):
+        """Returns the interval position covering an integer address of one family, or -1."""
+        starts, ends, _ = self._columns(version)
+        position = bisect.bisect_right(starts, address) - 1
+        if position >= 0 and address <= ends[position]:
+            return position
+        return -1
+
+    def __contains__(self, address):
+        version = 4
+        if isinstance(address, str):
+            version, address = parse_ip(address)
+        return self.find(address, version) >= 0
+
+    def owner(self, address, version=4):
+        """Returns the owning ASN for an address, NO_ASN if it is covered but unattributed, or None."""
+        if isinstance(address, str):
+            version, address = parse_ip(address)
+        position = self.find(address, version)
+        return None if position < 0 else self._columns(version)[2][position]
+
+    def lookup_many(self, addresses):
+        """
+        Yields (text, owner) for each non-blank address string; owner is None when not covered
+        and INVALID when the text is not an address, so results line up with the input.
+        """
+        find, asns, asns6 = self.find, self.asns, self.asns6
+        for text in addresses:
+            text = text.strip()
+            if not text:
+                continue
+            try:
+                if ":" in text:
+                    _, address = parse_ip(text)
+                    position = find(address, 6)
+                    yield text, (None if position < 0 else asns6[position])
+                    continue
+                position = find(parse_ipv4(text))
+            except ValueError:
+                yield text, INVALID
+                continue
+            yield text, (None if position < 0 else asns[position])
+
+    # --- Serialization ---
+    @staticmethod
+    def _write_uint32(f, column):
+        if sys.byteorder == "big":
+            column = array("I", column)
+            column.byteswap()
+        column.tofile(f)
+
+    @staticmethod
+    def _read_uint32(f, count):
+        column = array("I")
+        column.fromfile(f, count)
+        if sys.byteorder == "big":
+            column.byteswap()
+        return column
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(INDEX_MAGIC + INDEX_HEADER.pack(len(self.starts), len(self.starts6)))
+            for column in (self.starts, self.ends, self.asns):
+                self._write_uint32(f, column)
+            for column in (self.starts6, self.ends6):
+                f.write(b"".join(value.to_bytes(IPV6_WIDTH, "big") for value in column))
+            self._write_uint32(f, self.asns6)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                raise ValueError(f"'{path}' is not an Ipshin lookup index")
+            header = f.read(INDEX_HEADER.size)
+            if len(header) != INDEX_HEADER.size:
+                raise EOFError("read() didn't return enough bytes")
+            count, count6 = INDEX_HEADER.unpack(header)
+            columns = [cls._read_uint32(f, count) for _ in range(3)]
+            for _ in range(2):
+                raw = f.read(count6 * IPV6_WIDTH)
+                if len(raw) != count6 * IPV6_WIDTH:
+                    raise EOFError("read() didn't return enough bytes")
+                columns.append(
+                    [
+                        int.from_bytes(raw[i : i + IPV6_WIDTH], "big")
+                        for i in range(0, len(raw), IPV6_WIDTH)
+                    ]
+                )
+            columns.append(cls._read_uint32(f, count6))
+        return cls(*columns)
@@ -0,0 +1,278 @@
+import bisect
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+# --- Metric Configuration ---
+# Upper bounds in seconds, shared by every latency and duration histogram.
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUANTILES = (0.5, 0.9, 0.99)
+# From Python 3.12 cProfile is built on sys.monitoring: only one profiler may be active,
+# and it already sees every thread.
+SHARED_PROFILER = sys.version_info >= (3, 12)
+
+
+class Histogram:
+    """Fixed-bucket histogram in the Prometheus style; buckets are stored non-cumulatively."""
+
+    def __init__(self, bounds=SECONDS_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimates a quantile as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative(self):
+        """Returns [(le, cumulative count)], ending with '+Inf'."""
+        result, seen = [], 0
+        for bound, count in zip(self.bounds + ("+Inf",), self.counts):
+            seen += count
+            result.append((bound, seen))
+        return result
+
+
+class Metrics:
+    """
+    Thread-safe counters, histograms and optional per-request events for one run.
+    Names follow Prometheus conventions: counters end in _total, durations in _seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.keep_events = False
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self.events = []
+            self.started = time.time()
+            self._started = time.perf_counter()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def event(self, kind, **fields):
+        """Records one per-request event, such as a single ASN fetch, when keep_events is on."""
+        if self.keep_events:
+            fields["event"] = kind
+            with self._lock:
+                self.events.append(fields)
+
+    @contextlib.contextmanager
+    def timed(self, name, **labels):
+        """Observes the duration of the with-block in the histogram name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # --- Reports ---
+    def elapsed(self):
+        return time.perf_counter() - self._started
+
+    def records(self):
+        """Returns the metrics as a list of JSON-ready dicts, followed by the events."""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+            events = list(self.events)
+        elapsed = self.elapsed()
+        records = [{"type": "run", "started": self.started, "elapsed_seconds": round(elapsed, 3)}]
+        for (name, labels), value in counters:
+            record = {"type": "counter", "name": name, "labels": dict(labels), "value": value}
+            if name == "ipshin_items_total" and elapsed:
+                record["per_second"] = round(value / elapsed, 1)
+            records.append(record)
+        for (name, labels), histogram in histograms:
+            record = {
+                "type": "histogram",
+                "name": name,
+                "labels": dict(labels),
+                "count": histogram.count,
+                "sum": round(histogram.sum, 6),
+                "max": round(histogram.max, 6),
+                "buckets": {str(le): count for le, count in histogram.cumulative()},
+            }
+            for q in QUANTILES:
+                record[f"p{int(q * 100)}"] = histogram.quantile(q)
+            records.append(record)
+        for event in events:
+            records.append(dict(event, type="event"))
+        return records
+
+    def to_jsonl(self):
+        return "".join(json.dumps(record, sort_keys=True) + "\n" for record in self.records())
+
+    def to_prometheus(self):
+        """Renders the counters and histograms in the Prometheus text exposition format."""
+
+        def labels_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        lines, typed = [], set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter\n")
+                typed.add(name)
+            lines.append(f"{name}{labels_text(labels)} {value}\n")
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram\n")
+                typed.add(name)
+            for le, count in histogram.cumulative():
+                lines.append(f"{name}_bucket{labels_text(labels, [('le', le)])} {count}\n")
+            lines.append(f"{name}_sum{labels_text(labels)} {histogram.sum:.6f}\n")
+            lines.append(f"{name}_count{labels_text(labels)} {histogram.count}\n")
+        lines.append("# TYPE ipshin_run_seconds gauge\n")
+        lines.append(f"ipshin_run_seconds {self.elapsed():.3f}\n")
+        return "".join(lines)
+
+    def write(self, path):
+        """Writes a Prometheus textfile for *.prom paths and JSON lines otherwise, replacing path atomically."""
+        content = self.to_prometheus() if path.endswith(".prom") else self.to_jsonl()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+METRICS = Metrics()
+
+
+def record_fetch(stage, started, response, items=None, **fields):
+    """
+    Records one fetch of a stage ('page' or 'prefixes') started at perf_counter() time
+    started: its latency, outcome and item count, plus a per-request event carrying fields.
+    response is the Fetched result, or None when the request raised; items is None when
+    the body could not be parsed.
+    """
+    seconds = time.perf_counter() - started
+    if response is None:
+        result = "error"
+    elif response.status_code != 200:
+        result = "http_error"
+    elif items is None:
+        result = "invalid"
+    else:
+        result = "cached" if response.from_cache else "ok"
+    count = len(items) if items else 0
+    METRICS.observe("ipshin_fetch_seconds", seconds, stage=stage)
+    METRICS.inc("ipshin_fetch_total", stage=stage, result=result)
+    if count:
+        METRICS.inc("ipshin_items_total", count, stage=stage)
+    METRICS.event(
+        stage,
+        seconds=round(seconds, 4),
+        result=result,
+        status=None if response is None else response.status_code,
+        bytes=0 if response is None else len(response.text),
+        items=count,
+        **fields,
+    )
+
+
+# --- Profiling ---
+class ThreadProfiler:
+    """
+    cProfile for every thread. Before Python 3.12 the main thread and each thread started
+    while it is active, such as fetch workers, get their own profiler, merged when saved;
+    from 3.12 one profiler covers them all.
+    """
+
+    def __init__(self):
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    def _start_thread(self, frame, event, arg):
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        if not SHARED_PROFILER:
+            threading.setprofile(self._start_thread)
+        self._start_thread(None, None, None)
+
+    def stop(self, path):
+        if not SHARED_PROFILER:
+            threading.setprofile(None)
+        with self._lock:
+            profiles = list(self._profiles)
+        for profile in profiles:
+            profile.disable()
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+
+
+# --- Command-Line Hooks ---
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics", help="write a metrics report here: a Prometheus textfile for *.prom, JSON lines otherwise")
+    parser.add_argument("--profile", help="write cProfile statistics here, read them with 'python -m pstats'")
+
+
+@contextlib.contextmanager
+def instrumented(args):
+    """Collects metrics for one command and writes the --metrics and --profile reports afterwards."""
+    path = getattr(args, "metrics", None)
+    profile_path = getattr(args, "profile", None)
+    METRICS.reset()
+    METRICS.keep_events = bool(path) and not path.endswith(".prom")
+    profiler = ThreadProfiler() if profile_path else None
+    if profiler:
+        profiler.start()
+    try:
+        yield METRICS
+    finally:
+        if profiler:
+            profiler.stop(profile_path)
+        if path:
+            METRICS.write(path)
@@ -0,0 +1,212 @@
+import os
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+
+from aggregate import range_to_cidrs
+from prefixset import PREFIXLEN_BITS, PREFIXLEN_MASK, PrefixSet, pack, parse_cidr, parse_ipv4_cidr
+
+# --- Parallel Configuration ---
+# IPv4 work is sharded by address range: every prefix of /SHARD_BITS or longer lies inside
+# one of the 2**SHARD_BITS top-level blocks, so shards made of whole blocks are independent
+# apart from the few wider prefixes, which are handed to every shard they overlap.
+# Keys cross process boundaries as array('Q') byte buffers, never as IPv4Network objects.
+SHARD_BITS = 8
+SHARD_SHIFT = PREFIXLEN_BITS + 32 - SHARD_BITS
+SHARD_COUNT = 1 << SHARD_BITS
+SHARDS_PER_PROCESS = 4
+MIN_PARALLEL_PREFIXES = 200000
+# A CIDR line averages about 16 characters.
+MIN_PARALLEL_CHARS = MIN_PARALLEL_PREFIXES * 16
+
+
+def default_processes():
+    return os.cpu_count() or 1
+
+
+def key_end(key):
+    """Returns the last IPv4 address covered by a packed key."""
+    network = key >> PREFIXLEN_BITS
+    return network | ((1 << (32 - (key & PREFIXLEN_MASK))) - 1)
+
+
+def plan_shards(counts, shards):
+    """
+    Groups consecutive top-level blocks into at most `shards` (first, stop) ranges
+    holding roughly equal numbers of keys; empty groups are left out.
+    """
+    total = sum(counts)
+    groups, first, seen = [], 0, 0
+    for block, count in enumerate(counts):
+        seen += count
+        if seen * shards >= total * (len(groups) + 1) or block == len(counts) - 1:
+            groups.append((first, block + 1))
+            first = block + 1
+    return [(first, stop) for first, stop in groups if sum(counts[first:stop])]
+
+
+def crossing_keys(wide, first):
+    """Returns the wide keys that start before block `first` and reach into it, in key order."""
+    start = first << (32 - SHARD_BITS)
+    return [key for key in wide if key >> PREFIXLEN_BITS < start and key_end(key) >= start]
+
+
+# --- Workers ---
+def _parse_chunk(text):
+    """
+    Parses CIDR lines into IPv4 keys bucketed by top-level block, as byte buffers, IPv6 keys
+    and the malformed lines.
+    """
+    buckets = [array("Q") for _ in range(SHARD_COUNT)]
+    keys6 = []
+    skipped = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            if ":" in line:
+                _, network, prefixlen = parse_cidr(line)
+                keys6.append(pack(network, prefixlen))
+                continue
+            network, prefixlen = parse_ipv4_cidr(line)
+        except ValueError:
+            skipped.append(line)
+            continue
+        key = network << PREFIXLEN_BITS | prefixlen
+        buckets[key >> SHARD_SHIFT].append(key)
+    return [bucket.tobytes() for bucket in buckets], keys6, skipped
+
+
+def _sort_shard(data):
+    keys = array("Q")
+    keys.frombytes(data)
+    return PrefixSet.from_keys(keys).keys(4).tobytes()
+
+
+def _aggregate_shard(data, crossing, collapse):
+    """Aggregates one shard of sorted keys, led by the wider keys that reach into it."""
+    keys = array("Q", crossing)
+    keys.frombytes(data)
+    return PrefixSet.from_sorted_keys(keys).aggregated(collapse).keys(4).tobytes()
+
+
+# --- Merging ---
+def merge_shard(result, keys, collapse=False):
+    """
+    Appends one shard's aggregated keys to result, fixing up the seam in a single pass:
+    keys already covered by an earlier shard are dropped, and with collapse the ranges
+    meeting at the seam are merged and split into blocks again.
+    """
+    if not result:
+        result.extend(keys)
+        return
+    reach = key_end(result[-1])
+    index = 0
+    if collapse and keys and keys[0] >> PREFIXLEN_BITS <= reach + 1:
+        run = len(result) - 1
+        while run and key_end(result[run - 1]) + 1 == result[run] >> PREFIXLEN_BITS:
+            run -= 1
+        start = result[run] >> PREFIXLEN_BITS
+        while index < len(keys) and keys[index] >> PREFIXLEN_BITS <= reach + 1:
+            reach = max(reach, key_end(keys[index]))
+            index += 1
+        del result[run:]
+        result.extend(pack(*block) for block in range_to_cidrs(start, reach))
+    else:
+        while index < len(keys) and key_end(keys[index]) <= reach:
+            index += 1
+    result.extend(keys[index:])
+
+
+def _from_buffers(buffers):
+    keys = array("Q")
+    for data in buffers:
+        keys.frombytes(data)
+    return keys
+
+
+# --- Entry Points ---
+def parse_prefix_text(text, processes=None, skipped=None):
+    """
+    Parses CIDR lines like PrefixSet.from_text, splitting the text across processes.
+    Each process buckets its lines by address range, then each range is sorted in parallel,
+    so the concatenated ranges are the set's sorted keys without a final merge.
+    """
+    processes = processes or default_processes()
+    if processes <= 1 or len(text) < MIN_PARALLEL_CHARS:
+        return PrefixSet.from_text(text.splitlines(), skipped)
+    chunks, position = [], 0
+    size = len(text) // (processes * SHARDS_PER_PROCESS) + 1
+    while position < len(text):
+        end = text.find("\n", position + size)
+        end = len(text) if end < 0 else end + 1
+        chunks.append(text[position:end])
+        position = end
+    with ProcessPoolExecutor(processes) as executor:
+        parsed = list(executor.map(_parse_chunk, chunks))
+        bad = [line for _, _, lines in parsed for line in lines]
+        if bad and skipped is None:
+            parse_cidr(bad[0])  # raises the first malformed line's own error
+        if skipped is not None:
+            skipped.extend(bad)
+        counts = [sum(len(buckets[block]) for buckets, _, _ in parsed) for block in range(SHARD_COUNT)]
+        shards = plan_shards(counts, processes * SHARDS_PER_PROCESS)
+        shard_data = [
+            b"".join(buckets[block] for buckets, _, _ in parsed for block in range(first, stop))
+            for first, stop in shards
+        ]
+        prefixes = PrefixSet.from_sorted_keys(_from_buffers(executor.map(_sort_shard, shard_data)))
+    for _, keys6, _ in parsed:
+        prefixes.update_keys(keys6, 6)
+    return prefixes
+
+
+def aggregate_prefixes(prefixes, collapse=False, processes=None):
+    """
+    Returns the same PrefixSet as prefixes.aggregated(collapse), aggregating IPv4 shards in
+    separate processes and merging their results in one linear pass. Small sets and IPv6,
+    whose keys do not fit an array('Q'), are aggregated in this process.
+    """
+    processes = processes or default_processes()
+    if not isinstance(prefixes, PrefixSet):
+        prefixes = PrefixSet(prefixes)
+    keys = prefixes.keys(4)
+    if processes <= 1 or len(keys) < MIN_PARALLEL_PREFIXES:
+        return prefixes.aggregated(collapse)
+    bounds = [bisect_left(keys, block << SHARD_SHIFT) for block in range(SHARD_COUNT + 1)]
+    wide = []
+    for block in range(SHARD_COUNT):
+        # Wider keys start on a block boundary and sort first within their block.
+        index = bounds[block]
+        while index < bounds[block + 1] and keys[index] & PREFIXLEN_MASK < SHARD_BITS:
+            wide.append(keys[index])
+            index += 1
+    counts = [bounds[block + 1] - bounds[block] for block in range(SHARD_COUNT)]
+    shards = plan_shards(counts, processes * SHARDS_PER_PROCESS)
+    result = array("Q")
+    with ProcessPoolExecutor(min(processes, len(shards))) as executor:
+        futures = [
+            executor.submit(
+                _aggregate_shard,
+                keys[bounds[first] : bounds[stop]].tobytes(),
+                crossing_keys(wide, first),
+                collapse,
+            )
+            for first, stop in shards
+        ]
+        for future in futures:
+            merge_shard(result, _from_buffers([future.result()]), collapse)
+    aggregated = PrefixSet.from_sorted_keys(result)
+    aggregated.update_keys(prefixes.family(6).aggregated(collapse).keys(6), 6)
+    return aggregated
+
+
+# --- Command-Line Hooks ---
+def add_process_arguments(parser):
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="parse and aggregate large prefix sets in this many processes, 0 for one per core",
+    )
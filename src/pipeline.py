@@ -0,0 +1,108 @@
+import queue
+import threading
+
+from asnfinder import DEFAULT_COUNTRY, REPORT_URL, iter_report_pages
+from httpclient import RequestScheduler, create_session
+from ipfinder import API_URL, fetch_announced_prefixes
+from ipfinder import HEADERS as API_HEADERS
+from metrics import METRICS
+from prefixset import PrefixAggregator
+
+# --- Pipeline Configuration ---
+DEFAULT_PAGE_WORKERS = 4
+DEFAULT_FETCH_WORKERS = 8
+DEFAULT_QUEUE_SIZE = 256
+
+
+def run_pipeline(
+    pages=None,
+    countries=(DEFAULT_COUNTRY,),
+    page_workers=DEFAULT_PAGE_WORKERS,
+    fetch_workers=DEFAULT_FETCH_WORKERS,
+    queue_size=DEFAULT_QUEUE_SIZE,
+    cache=None,
+    collapse=False,
+    report_url=REPORT_URL,
+    api_url=API_URL,
+    page_scheduler=None,
+    api_scheduler=None,
+    max_pages=None,
+):
+    """
+    Scrapes report pages and fetches prefixes at the same time.
+    Each ASN is queued for prefix fetching as soon as its page is parsed; the bounded
+    queue blocks scrapers when fetchers fall behind, and prefixes stream into a
+    PrefixAggregator as they arrive. Pages and prefixes come from different hosts,
+    so each stage has its own RequestScheduler.
+    With pages=None every country's report is paginated automatically.
+    Returns (final_prefixes, asns, failed_pages, failed_asns); failed pages are 'CC:page' strings.
+    """
+    page_scheduler = page_scheduler or RequestScheduler()
+    api_scheduler = api_scheduler or RequestScheduler()
+    asn_queue = queue.Queue(maxsize=queue_size)
+    aggregator = PrefixAggregator(collapse)
+    seen = {}
+    failed_pages = []
+    failed_asns = []
+
+    def fetch_worker(session):
+        while True:
+            asn = asn_queue.get()
+            if asn is None:
+                return
+            try:
+                prefixes = fetch_announced_prefixes(
+                    asn, session, api_url, cache, api_scheduler
+                )
+            except Exception:
+                prefixes = None
+            if prefixes is None:
+                failed_asns.append(asn)
+            else:
+                aggregator.add(prefixes)
+
+    with create_session(fetch_workers, API_HEADERS) as api_session:
+        fetchers = [
+            threading.Thread(target=fetch_worker, args=(api_session,), daemon=True)
+            for _ in range(fetch_workers)
+        ]
+        for thread in fetchers:
+            thread.start()
+        try:
+            for country, page, page_asns in iter_report_pages(
+                countries, pages, page_workers, report_url, cache, page_scheduler, max_pages
+            ):
+                if page_asns is None:
+                    failed_pages.append(f"{country}:{page}")
+                    continue
+                for asn in page_asns:
+                    if asn not in seen:
+                        seen[asn] = None
+                        asn_queue.put(asn)
+        except BaseException:
+            # Drop the queued ASNs, so on Ctrl+C the fetchers stop after their current request.
+            while True:
+                try:
+                    asn_queue.get_nowait()
+                except queue.Empty:
+                    break
+            raise
+        finally:
+            for _ in fetchers:
+                asn_queue.put(None)
+            for thread in fetchers:
+                thread.join()
+
+        retry_asns, failed_asns = failed_asns, []
+        for asn in retry_asns:
+            prefixes = fetch_announced_prefixes(
+                asn, api_session, api_url, cache, api_scheduler
+            )
+            if prefixes is None:
+                failed_asns.append(asn)
+            else:
+                aggregator.add(prefixes)
+
+    with METRICS.timed("ipshin_stage_seconds", stage="aggregate"):
+        final_prefixes = aggregator.result()
+    return final_prefixes, list(seen), sorted(failed_pages), failed_asns
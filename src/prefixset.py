@@ -0,0 +1,321 @@
+import bisect
+import ipaddress
+import re
+import socket
+import sys
+import threading
+from array import array
+
+from aggregate import drop_contained, merge_adjacent, range_to_cidrs
+
+# --- Packed Prefix Keys ---
+# A prefix is stored as one integer key: network << 8 | prefixlen. IPv4 keys fit an
+# unsigned 64-bit array slot; IPv6 keys need 136 bits and are kept as Python ints.
+# Sorting the keys orders prefixes by start address and then widest first,
+# which is exactly the order the aggregation sweep needs.
+PREFIXLEN_BITS = 8
+PREFIXLEN_MASK = (1 << PREFIXLEN_BITS) - 1
+ADDRESS_BITS = {4: 32, 6: 128}
+
+
+_CIDR_RE = re.compile(
+    r"(0|[1-9]\d{0,2})\.(0|[1-9]\d{0,2})\.(0|[1-9]\d{0,2})\.(0|[1-9]\d{0,2})(?:/(\d{1,2}))?"
+)
+
+
+def parse_ipv4_cidr(text):
+    """
+    Parses 'a.b.c.d/n' straight to (network, prefixlen) integers without building an IPv4Network.
+    Raises ValueError for malformed input or host bits set, like IPv4Network does.
+    """
+    match = _CIDR_RE.fullmatch(text.strip())
+    if match is None:
+        raise ValueError(f"Invalid IPv4 prefix '{text}'")
+    a, b, c, d, length = match.groups()
+    a, b, c, d = int(a), int(b), int(c), int(d)
+    prefixlen = 32 if length is None else int(length)
+    if a > 255 or b > 255 or c > 255 or d > 255 or prefixlen > 32:
+        raise ValueError(f"Invalid IPv4 prefix '{text}'")
+    network = a << 24 | b << 16 | c << 8 | d
+    if network & (0xFFFFFFFF >> prefixlen):
+        raise ValueError(f"'{text}' has host bits set")
+    return network, prefixlen
+
+
+def parse_ipv6_cidr(text):
+    """Parses an IPv6 'addr/n' string to (network, prefixlen) integers, with the same checks."""
+    address, _, length = text.strip().partition("/")
+    try:
+        network = int.from_bytes(socket.inet_pton(socket.AF_INET6, address), "big")
+    except (OSError, ValueError):
+        raise ValueError(f"Invalid IPv6 prefix '{text}'") from None
+    if length and not (length.isdigit() and len(length) <= 3):
+        raise ValueError(f"Invalid prefix length in '{text}'")
+    prefixlen = int(length) if length else 128
+    if prefixlen > 128:
+        raise ValueError(f"Invalid prefix length in '{text}'")
+    if network & ((1 << (128 - prefixlen)) - 1):
+        raise ValueError(f"'{text}' has host bits set")
+    return network, prefixlen
+
+
+def parse_cidr(text):
+    """Returns (version, network, prefixlen) for an IPv4 or IPv6 CIDR string."""
+    if ":" in text:
+        return (6,) + parse_ipv6_cidr(text)
+    return (4,) + parse_ipv4_cidr(text)
+
+
+def format_ipv4_cidr(network, prefixlen):
+    return f"{network >> 24}.{network >> 16 & 255}.{network >> 8 & 255}.{network & 255}/{prefixlen}"
+
+
+def format_ipv6_cidr(network, prefixlen):
+    return f"{ipaddress.IPv6Address(network)}/{prefixlen}"
+
+
+def pack(network, prefixlen):
+    return network << PREFIXLEN_BITS | prefixlen
+
+
+def unpack(key):
+    return key >> PREFIXLEN_BITS, key & PREFIXLEN_MASK
+
+
+def _new_keys(version, values=()):
+    return array("Q", values) if version == 4 else list(values)
+
+
+def _merge_keys(version, keys, pending):
+    """
+    Merges sorted unique keys with unsorted pending keys in one linear pass, dropping
+    duplicates; only the pending keys are sorted.
+    """
+    merged = _new_keys(version)
+    append = merged.append
+    index, count, last = 0, len(keys), -1
+    for key in sorted(pending):
+        while index < count and keys[index] < key:
+            append(keys[index])
+            index += 1
+        if index < count and keys[index] == key:
+            index += 1
+        if key != last:
+            append(key)
+            last = key
+    merged.extend(keys[index:])
+    return merged
+
+
+class PrefixSet:
+    """
+    Compact, deduplicated dual-stack prefix set backed by sorted packed keys per address family:
+    an array('Q') for IPv4 and a list of ints for IPv6. Inserts are buffered and merged in bulk,
+    so building a set of millions of prefixes costs 8 bytes per IPv4 prefix instead of one
+    IPv4Network object each.
+    """
+
+    def __init__(self, prefixes=()):
+        self._keys = {4: _new_keys(4), 6: _new_keys(6)}
+        self._pending = {4: _new_keys(4), 6: _new_keys(6)}
+        self.update(prefixes)
+
+    # --- Building ---
+    @staticmethod
+    def _key(prefix):
+        """Returns (version, key) for an ip_network, a CIDR string or a (network, prefixlen) IPv4 pair."""
+        if isinstance(prefix, str):
+            version, network, prefixlen = parse_cidr(prefix)
+            return version, pack(network, prefixlen)
+        if isinstance(prefix, tuple):
+            return 4, pack(*prefix)
+        return prefix.version, pack(int(prefix.network_address), prefix.prefixlen)
+
+    def add(self, prefix):
+        """Adds an IPv4Network/IPv6Network, a CIDR string or an IPv4 (network, prefixlen) pair."""
+        version, key = self._key(prefix)
+        self._pending[version].append(key)
+
+    def update(self, prefixes):
+        """Adds many prefixes at once; another PrefixSet is merged without unpacking."""
+        if isinstance(prefixes, PrefixSet):
+            for version in ADDRESS_BITS:
+                self._pending[version].extend(prefixes.keys(version))
+            return
+        pending4, pending6 = self._pending[4], self._pending[6]
+        for prefix in prefixes:
+            version, key = self._key(prefix)
+            (pending4 if version == 4 else pending6).append(key)
+
+    def update_keys(self, keys, version=4):
+        self._pending[version].extend(keys)
+
+    @classmethod
+    def from_text(cls, lines, skipped=None):
+        """
+        Builds a set from CIDR lines, skipping blanks and '#' comments. A malformed line
+        raises ValueError, or is appended to the skipped list when one is given.
+        """
+        if skipped is None:
+            return cls(
+                line.strip()
+                for line in lines
+                if line.strip() and not line.lstrip().startswith("#")
+            )
+        result = cls()
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                result.add(line)
+            except ValueError:
+                skipped.append(line)
+        return result
+
+    @classmethod
+    def from_keys(cls, keys, version=4):
+        result = cls()
+        result._pending[version].extend(keys)
+        return result
+
+    @classmethod
+    def from_sorted_keys(cls, keys, version=4):
+        """Wraps keys that are already sorted and unique, skipping the merge that from_keys does."""
+        result = cls()
+        if isinstance(keys, array) != (version == 4):
+            keys = _new_keys(version, keys)
+        result._keys[version] = keys
+        return result
+
+    def keys(self, version=4):
+        """Returns the sorted, unique packed keys of one address family."""
+        if self._pending[version]:
+            self._keys[version] = _merge_keys(version, self._keys[version], self._pending[version])
+            self._pending[version] = _new_keys(version)
+        return self._keys[version]
+
+    def family(self, version):
+        """Returns a new PrefixSet with only the IPv4 or IPv6 prefixes."""
+        return PrefixSet.from_keys(self.keys(version), version)
+
+    # --- Queries ---
+    def __len__(self):
+        return len(self.keys(4)) + len(self.keys(6))
+
+    def __iter__(self):
+        for key in self.keys(4):
+            yield ipaddress.IPv4Network(unpack(key))
+        for key in self.keys(6):
+            yield ipaddress.IPv6Network(unpack(key))
+
+    def __contains__(self, prefix):
+        version, key = self._key(prefix)
+        keys = self.keys(version)
+        index = bisect.bisect_left(keys, key)
+        return index < len(keys) and keys[index] == key
+
+    def __eq__(self, other):
+        return isinstance(other, PrefixSet) and all(
+            self.keys(v) == other.keys(v) for v in ADDRESS_BITS
+        )
+
+    def covers(self, prefix):
+        """True if the prefix equals or lies inside any member of the set."""
+        version, key = self._key(prefix)
+        network, prefixlen = unpack(key)
+        bits = ADDRESS_BITS[version]
+        keys = self.keys(version)
+        for length in range(prefixlen, -1, -1):
+            candidate = pack(network >> (bits - length) << (bits - length), length)
+            index = bisect.bisect_left(keys, candidate)
+            if index < len(keys) and keys[index] == candidate:
+                return True
+        return False
+
+    def ranges(self, version=4):
+        """Yields (start, end) integer ranges of one family, ordered by start, widest first."""
+        bits = ADDRESS_BITS[version]
+        for key in self.keys(version):
+            network, prefixlen = unpack(key)
+            yield network, network | ((1 << (bits - prefixlen)) - 1)
+
+    @property
+    def nbytes(self):
+        keys4, keys6 = self.keys(4), self.keys(6)
+        return keys4.itemsize * len(keys4) + sum(sys.getsizeof(k) for k in keys6)
+
+    # --- Aggregation and Text ---
+    def aggregated(self, collapse=False):
+        """Returns a new PrefixSet without covered subnets; collapse=True also merges siblings."""
+        result = PrefixSet()
+        for version, bits in ADDRESS_BITS.items():
+            ranges = drop_contained(self.ranges(version))
+            if collapse:
+                keys = [
+                    pack(*block)
+                    for start, end in merge_adjacent(ranges)
+                    for block in range_to_cidrs(start, end, bits)
+                ]
+            else:
+                keys = [
+                    pack(start, bits + 1 - (end - start + 1).bit_length())
+                    for start, end in ranges
+                ]
+            result._keys[version] = _new_keys(version, keys)
+        return result
+
+    def to_text(self):
+        """Renders the set as CIDR lines, IPv4 first, each family in address order."""
+        lines = [
+            format_ipv4_cidr(key >> PREFIXLEN_BITS, key & PREFIXLEN_MASK) + "\n"
+            for key in self.keys(4)
+        ]
+        lines.extend(
+            format_ipv6_cidr(key >> PREFIXLEN_BITS, key & PREFIXLEN_MASK) + "\n"
+            for key in self.keys(6)
+        )
+        return "".join(lines)
+
+
+def network_sort_key(net):
+    """Output order of cleaned lists: IPv4 before IPv6, then widest first, then by address."""
+    return net.version, net.prefixlen, int(net.network_address)
+
+
+class PrefixAggregator:
+    """
+    Thread-safe accumulator for prefixes that arrive in batches.
+    The collected set is re-aggregated whenever the prefixes added since the last pass
+    outnumber the ones kept, so memory stays within a small multiple of the cleaned result.
+    """
+
+    def __init__(self, collapse=False, min_compact=10000):
+        self.collapse = collapse
+        self.min_compact = min_compact
+        self._prefixes = PrefixSet()
+        self._kept = 0
+        self._added = 0
+        self._lock = threading.Lock()
+
+    def add(self, prefixes):
+        if not isinstance(prefixes, PrefixSet):
+            prefixes = PrefixSet(prefixes)
+        with self._lock:
+            self._prefixes.update(prefixes)
+            self._added += len(prefixes)
+            if self._added > max(self.min_compact, self._kept):
+                self._compact()
+
+    def _compact(self):
+        self._prefixes = self._prefixes.aggregated(self.collapse)
+        self._kept = len(self._prefixes)
+        self._added = 0
+
+    def result(self):
+        """Returns the cleaned prefixes sorted like ipfinder.remove_subnets."""
+        with self._lock:
+            self._compact()
+            cleaned = list(self._prefixes)
+        cleaned.sort(key=network_sort_key)
+        return cleaned
@@ -0,0 +1,390 @@
+import gzip
+import hashlib
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from export import DEFAULT_POLICY, FORMATS, render
+from incremental import diff_prefixes
+from ipfinder import (
+    API_URL,
+    DEFAULT_WORKERS,
+    FAMILIES,
+    fetch_prefixes_concurrently,
+    remove_subnets,
+    select_family,
+)
+from lookup import INVALID, LookupIndex
+from metrics import METRICS
+from prefixset import PrefixSet
+
+# --- Service Configuration ---
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8787
+DEFAULT_INTERVAL = 6 * 60 * 60
+GZIP_MIN_BYTES = 1024
+MAX_LOOKUP_BODY = 16 * 1024 * 1024
+CONTENT_TYPES = {"mmdb": "application/octet-stream", "json": "application/json"}
+
+
+class Snapshot:
+    """
+    One immutable build of the served data: the cleaned prefix list, a LookupIndex with
+    owner ASNs and the diff against the previous build. Rendered response bodies are
+    memoised per variant, so each is built once per snapshot however often it is served.
+    """
+
+    def __init__(self, generation, asn_prefixes, collapse=False, previous=None, failed=()):
+        merged = PrefixSet()
+        for prefixes in asn_prefixes.values():
+            merged.update(prefixes)
+        self.generation = generation
+        self.built_at = time.time()
+        self.asn_prefixes = asn_prefixes
+        self.failed = list(failed)
+        self.prefixes = remove_subnets(merged, collapse=collapse)
+        self.index = LookupIndex.from_asn_map(asn_prefixes)
+        self.added, self.removed = diff_prefixes(
+            previous.prefixes if previous is not None else [], self.prefixes
+        )
+        digest = hashlib.sha1("".join(f"{p}\n" for p in self.prefixes).encode())
+        self.etag = digest.hexdigest()[:20]
+        self._bodies = {}
+        self._lock = threading.Lock()
+
+    def body(self, key, build):
+        """Returns the memoised body for key, building it with build() on first use."""
+        body = self._bodies.get(key)
+        if body is None:
+            with self._lock:
+                body = self._bodies.get(key)
+                if body is None:
+                    body = self._bodies[key] = build()
+        return body
+
+
+class PrefixService:
+    """
+    Keeps the current Snapshot and rebuilds it in the background every `interval` seconds.
+    A rebuild fetches every ASN from list_asns() and replaces the snapshot with a single
+    reference assignment, so readers are never blocked and always see one complete build.
+    ASNs that fail keep their prefixes from the previous build; a rebuild that fails
+    outright leaves the previous snapshot in place.
+    """
+
+    def __init__(
+        self,
+        list_asns,
+        interval=DEFAULT_INTERVAL,
+        collapse=False,
+        workers=DEFAULT_WORKERS,
+        api_url=API_URL,
+        cache=None,
+        scheduler=None,
+    ):
+        self.list_asns = list_asns
+        self.interval = interval
+        self.collapse = collapse
+        self.workers = workers
+        self.api_url = api_url
+        self.cache = cache
+        self.scheduler = scheduler
+        self.snapshot = None
+        self.refreshing = False
+        self.last_error = None
+        self.next_refresh = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def build(self, previous):
+        asns = self.list_asns()
+        if not asns:
+            raise ValueError("no ASNs to fetch")
+        asn_prefixes = {}
+        failed = []
+        for asn, prefixes in fetch_prefixes_concurrently(
+            asns, self.workers, self.api_url, self.cache, self.scheduler
+        ):
+            if prefixes is not None:
+                asn_prefixes[asn] = prefixes
+                continue
+            failed.append(asn)
+            if previous is not None and asn in previous.asn_prefixes:
+                asn_prefixes[asn] = previous.asn_prefixes[asn]
+        if len(failed) == len(asns):
+            raise ValueError(f"all {len(asns)} ASNs failed")
+        generation = previous.generation + 1 if previous is not None else 1
+        return Snapshot(generation, asn_prefixes, self.collapse, previous, failed)
+
+    def refresh(self):
+        """Builds a new snapshot and swaps it in; returns True on success."""
+        self.refreshing = True
+        try:
+            with METRICS.timed("ipshin_stage_seconds", stage="refresh"):
+                snapshot = self.build(self.snapshot)
+        except Exception as e:
+            self.last_error = str(e)
+            METRICS.inc("ipshin_refresh_total", result="error")
+            print(f"  [!] Refresh failed, keeping the previous data: {e}")
+            return False
+        finally:
+            self.refreshing = False
+        self.snapshot = snapshot
+        self.last_error = None
+        METRICS.inc("ipshin_refresh_total", result="ok")
+        print(
+            f"  [i] Generation {snapshot.generation}: {len(snapshot.prefixes)} prefixes, "
+            f"+{len(snapshot.added)} -{len(snapshot.removed)}, {len(snapshot.failed)} ASNs failed."
+        )
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self.next_refresh = time.time() + self.interval
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def status(self):
+        snapshot = self.snapshot
+        status = {
+            "ready": snapshot is not None,
+            "refreshing": self.refreshing,
+            "interval": self.interval,
+            "next_refresh": self.next_refresh,
+            "last_error": self.last_error,
+        }
+        if snapshot is not None:
+            status.update(
+                generation=snapshot.generation,
+                built_at=snapshot.built_at,
+                etag=snapshot.etag,
+                prefixes=len(snapshot.prefixes),
+                asns=len(snapshot.asn_prefixes),
+                failed_asns=snapshot.failed,
+                ranges=len(snapshot.index),
+            )
+        return status
+
+
+# --- HTTP API ---
+def accepts_gzip(header):
+    """True if an Accept-Encoding header allows gzip."""
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def etag_matches(header, etag):
+    """True if an If-None-Match header names etag, ignoring weak-validator prefixes."""
+    if not header:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.replace("W/", "", 1) == etag:
+            return True
+    return False
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    GET /status                        service and snapshot state as JSON
+    GET /rules[/FORMAT][?family=4|6|both]  the prefix list as txt or rules, with ETag and gzip
+    GET /diff[?family=...]             prefixes added and removed by the last refresh
+    GET /lookup?ip=ADDR[&ip=...]       membership and owner ASN per address
+    POST /lookup                       the same for a body of addresses, one per line
+    GET /metrics                       Prometheus metrics of this process
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server_version = "ipshin"
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_HEAD(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def dispatch(self):
+        started = time.perf_counter()
+        self.body_read = False
+        url = urlsplit(self.path)
+        self.query = parse_qs(url.query)
+        parts = [part for part in url.path.split("/") if part]
+        route = parts[0] if parts else "status"
+        handler = getattr(self, f"route_{route}", None)
+        if handler is None:
+            route = "unknown"
+            status = self.send_json(404, {"error": f"unknown path '{url.path}'"})
+        elif self.command == "POST" and route != "lookup":
+            status = self.send_json(405, {"error": "only /lookup accepts POST"}, {"Allow": "GET, HEAD"})
+        else:
+            try:
+                status = handler(parts[1:])
+            except ValueError as e:
+                status = self.send_json(400, {"error": str(e)})
+        METRICS.inc("ipshin_serve_requests_total", route=route, status=str(status))
+        METRICS.observe("ipshin_serve_seconds", time.perf_counter() - started, route=route)
+
+    # --- Responses ---
+    def send_body(self, status, body, content_type, etag=None, variant=None, headers=None):
+        """
+        Sends body with an optional ETag, answering 304 when the client already has it.
+        Bodies are gzipped when the client accepts it; a (snapshot, key) variant
+        memoises the compressed body in the snapshot. Returns the status sent.
+        """
+        headers = dict(headers or {}, **{"Content-Type": content_type})
+        compress = len(body) >= GZIP_MIN_BYTES and accepts_gzip(self.headers.get("Accept-Encoding"))
+        if etag is not None:
+            # The gzip and identity bodies differ byte for byte, so they need distinct strong ETags.
+            etag = f'"{etag}-gz"' if compress else f'"{etag}"'
+            headers.update({"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"})
+            if etag_matches(self.headers.get("If-None-Match"), etag):
+                status, body, compress = 304, b"", False
+                del headers["Content-Type"]
+        if self.body_left_unread():
+            # Keep-alive would parse the unread body as the next request.
+            headers["Connection"] = "close"
+            self.close_connection = True
+        if compress:
+            if variant is not None:
+                snapshot, key = variant
+                body = snapshot.body(key + ("gzip",), lambda: gzip.compress(body, 6))
+            else:
+                body = gzip.compress(body, 6)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+        METRICS.inc("ipshin_serve_bytes_total", len(body))
+        return status
+
+    def body_left_unread(self):
+        """True when the request carried a body that no route has read."""
+        if self.body_read:
+            return False
+        length = (self.headers.get("Content-Length") or "0").strip()
+        return length != "0" or "Transfer-Encoding" in self.headers
+
+    def send_json(self, status, data, headers=None):
+        return self.send_body(status, json.dumps(data).encode(), CONTENT_TYPES["json"], headers=headers)
+
+    def current_snapshot(self):
+        """Returns the snapshot to answer from, or sends 503 and returns None before the first build."""
+        snapshot = self.server.service.snapshot
+        if snapshot is None:
+            self.send_json(503, {"error": "the first build is still running"}, {"Retry-After": "5"})
+        return snapshot
+
+    def family(self):
+        family = self.query.get("family", [self.server.family])[0]
+        if family not in FAMILIES:
+            raise ValueError(f"family must be one of {', '.join(FAMILIES)}")
+        return family
+
+    # --- Routes ---
+    def route_status(self, args):
+        return self.send_json(200, self.server.service.status())
+
+    def route_rules(self, args):
+        fmt = args[0] if args else self.server.format
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        family = self.family()
+        snapshot = self.current_snapshot()
+        if snapshot is None:
+            return 503
+        key = ("rules", fmt, family)
+
+        def build():
+            content = render(select_family(snapshot.prefixes, family), fmt, **self.server.options)
+            return content if isinstance(content, bytes) else content.encode()
+
+        body = snapshot.body(key, build)
+        content_type = CONTENT_TYPES.get(fmt, "text/plain; charset=utf-8")
+        etag = f"{snapshot.etag}-{fmt}-{family}"
+        return self.send_body(200, body, content_type, etag, (snapshot, key))
+
+    def route_diff(self, args):
+        family = self.family()
+        snapshot = self.current_snapshot()
+        if snapshot is None:
+            return 503
+        key = ("diff", family)
+
+        def build():
+            diff = {
+                "generation": snapshot.generation,
+                "built_at": snapshot.built_at,
+                "added": [str(p) for p in select_family(snapshot.added, family)],
+                "removed": [str(p) for p in select_family(snapshot.removed, family)],
+            }
+            return json.dumps(diff).encode()
+
+        body = snapshot.body(key, build)
+        etag = f"{snapshot.etag}-diff{snapshot.generation}-{family}"
+        return self.send_body(200, body, CONTENT_TYPES["json"], etag, (snapshot, key))
+
+    def route_lookup(self, args):
+        addresses = [ip for value in self.query.get("ip", []) for ip in value.split(",")]
+        if self.command == "POST":
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_LOOKUP_BODY:
+                raise ValueError("request body too large")
+            addresses.extend(self.rfile.read(length).decode("utf-8", "replace").split())
+            self.body_read = True
+        if not addresses:
+            raise ValueError("give addresses as ?ip=ADDR or one per line in a POST body")
+        snapshot = self.current_snapshot()
+        if snapshot is None:
+            return 503
+        results = [
+            {"ip": ip, "invalid": True}
+            if owner is INVALID
+            else {"ip": ip, "covered": owner is not None, "asn": owner or None}
+            for ip, owner in snapshot.index.lookup_many(addresses)
+        ]
+        return self.send_json(200, {"generation": snapshot.generation, "results": results})
+
+    def route_metrics(self, args):
+        body = METRICS.to_prometheus().encode()
+        return self.send_body(200, body, "text/plain; version=0.0.4")
+
+    def log_message(self, format, *args):
+        # Goes wherever progress goes, so --quiet silences the access log too.
+        sys.stdout.write(f"  [i] {self.address_string()} {format % args}\n")
+
+
+class ServiceServer(ThreadingHTTPServer):
+    """Serves a PrefixService; format, family and options are the defaults for /rules."""
+
+    daemon_threads = True
+
+    def __init__(self, address, service, format="txt", family="4", options=None):
+        super().__init__(address, ServiceHandler)
+        self.service = service
+        self.format = format
+        self.family = family
+        self.options = options or {"policy": DEFAULT_POLICY}
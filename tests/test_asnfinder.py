@@ -0,0 +1,19 @@
+import pytest
+
+import asnfinder
+
+
+@pytest.mark.parametrize("workers", ["0", "-2", "many"])
+def test_workers_must_be_positive(workers):
+    with pytest.raises(SystemExit) as exit_info:
+        asnfinder.run_cli(["--workers", workers])
+    assert exit_info.value.code == 2
+
+
+def test_value_errors_exit_with_an_error(monkeypatch, capsys):
+    def fail(args, out):
+        raise ValueError("bad input")
+
+    monkeypatch.setattr(asnfinder, "command_scan", fail)
+    assert asnfinder.run_cli(["--quiet"]) == 1
+    assert "asnfinder: bad input" in capsys.readouterr().err
@@ -0,0 +1,48 @@
+import io
+import os
+import struct
+import sys
+
+import bulk
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+import check_ingest  # noqa: E402
+
+
+def as_path(*asns):
+    path = struct.pack(">BB", 2, len(asns)) + struct.pack(f">{len(asns)}I", *asns)
+    return struct.pack(">BBB", 0x40, 2, len(path)) + path
+
+
+def rib_record(prefixlen, prefix_bytes, attributes, subtype=2):
+    body = struct.pack(">IB", 0, prefixlen) + prefix_bytes + struct.pack(">H", 1)
+    body += struct.pack(">HIH", 0, 0, len(attributes)) + attributes
+    return struct.pack(">IHHI", 0, 13, subtype, len(body)) + body
+
+
+def read_mrt(data):
+    return list(bulk.iter_mrt(io.BytesIO(data)))
+
+
+def test_samples_parse_into_expected_prefixes(tmp_path):
+    for name, expected, actual in check_ingest.run_checks(str(tmp_path)):
+        assert actual == expected, name
+
+
+def test_mrt_skips_corrupt_entries():
+    valid = rib_record(16, bytes([5, 160]), as_path(3356, 12880))
+    # An AS_PATH segment claiming more ASNs than it holds.
+    truncated_path = as_path(3356, 12880)[:-2]
+    truncated_path = truncated_path[:2] + bytes([len(truncated_path) - 3]) + truncated_path[3:]
+    corrupt = [
+        rib_record(16, bytes([5, 160]), truncated_path),
+        rib_record(33, bytes([1, 2, 3, 4, 5]), as_path(1)),
+        rib_record(24, bytes([1, 2]), b""),
+    ]
+    assert read_mrt(b"".join(corrupt) + valid) == [("12880", 4, 5 << 24 | 160 << 16, 16)]
+
+
+def test_mrt_masks_host_bits():
+    record = rib_record(22, bytes([185, 20, 163]), as_path(58224))
+    assert read_mrt(record) == [("58224", 4, 185 << 24 | 20 << 16 | 160 << 8, 22)]
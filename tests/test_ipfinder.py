@@ -0,0 +1,69 @@
+import ipfinder
+
+# Two adjacent /24s from different ASNs, which --collapse merges into one /23.
+PFX2AS = "10.0.0.0\t24\t64500\n10.0.1.0\t24\t64501\n"
+
+
+def run(*argv):
+    return ipfinder.run_cli([*argv, "--quiet"])
+
+
+def read_lines(path):
+    with open(path) as f:
+        return f.read().split()
+
+
+def test_incremental_fetch_after_ingest_follows_collapse(tmp_path):
+    dump = tmp_path / "dump.pfx2as"
+    dump.write_text(PFX2AS)
+    state = str(tmp_path / "state.json")
+    out = str(tmp_path / "out.txt")
+    fetch = ["fetch", "--asn", "64500", "64501", "--incremental", "--state", state]
+    fetch += ["--cache-mode", "bypass", "--out", out]
+
+    assert run("ingest", "--pfx2as", str(dump), "--collapse", "--state", state, "--out", out) == 0
+    assert read_lines(out) == ["10.0.0.0/23"]
+    # Both ASNs are fresh, so nothing is fetched and only the collapse setting changes.
+    assert run(*fetch) == 0
+    assert read_lines(out) == ["10.0.0.0/24", "10.0.1.0/24"]
+    assert run(*fetch, "--collapse") == 0
+    assert read_lines(out) == ["10.0.0.0/23"]
+
+
+def test_incremental_fetch_after_uncollapsed_ingest(tmp_path):
+    dump = tmp_path / "dump.pfx2as"
+    dump.write_text(PFX2AS)
+    state = str(tmp_path / "state.json")
+    out = str(tmp_path / "out.txt")
+
+    assert run("ingest", "--pfx2as", str(dump), "--state", state, "--out", out) == 0
+    assert read_lines(out) == ["10.0.0.0/24", "10.0.1.0/24"]
+    fetch = ["fetch", "--asn", "64500", "64501", "--incremental", "--state", state]
+    assert run(*fetch, "--cache-mode", "bypass", "--out", out, "--collapse") == 0
+    assert read_lines(out) == ["10.0.0.0/23"]
+
+
+def test_incremental_fetch_writes_the_same_annotated_table(tmp_path):
+    dump = tmp_path / "dump.pfx2as"
+    dump.write_text("10.0.0.0\t16\t64500\n10.0.1.0\t24\t64500\n10.1.0.0\t24\t64501\n")
+    state = str(tmp_path / "state.json")
+    out = str(tmp_path / "out.txt")
+    ingested, fetched = tmp_path / "ingested.csv", tmp_path / "fetched.csv"
+
+    assert run("ingest", "--pfx2as", str(dump), "--state", state, "--out", out, "--annotated", str(ingested)) == 0
+    # Both ASNs are fresh, so the table comes from the state file alone.
+    fetch = ["fetch", "--asn", "64500", "64501", "--incremental", "--state", state, "--cache-mode", "bypass"]
+    assert run(*fetch, "--out", out, "--annotated", str(fetched)) == 0
+    assert "10.0.1.0/24,64500,10.0.0.0/16" in read_lines(fetched)
+    assert fetched.read_text() == ingested.read_text()
+
+
+def test_annotated_range_follows_collapse(tmp_path):
+    dump = tmp_path / "dump.pfx2as"
+    dump.write_text(PFX2AS)
+    out = str(tmp_path / "out.txt")
+    annotated = tmp_path / "annotated.csv"
+
+    assert run("ingest", "--pfx2as", str(dump), "--collapse", "--out", out, "--annotated", str(annotated)) == 0
+    assert read_lines(out) == ["10.0.0.0/23"]
+    assert read_lines(annotated)[1:] == ["10.0.0.0/24,64500,10.0.0.0/23", "10.0.1.0/24,64501,10.0.0.0/23"]
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+
+import ipshin
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from fixtures import page_asns  # noqa: E402
+from mock_server import MockBGPView  # noqa: E402
+
+
+def test_pipeline_against_mock_server(tmp_path):
+    out = tmp_path / "prefixes.txt"
+    asn_out = tmp_path / "asns.txt"
+    with MockBGPView(pages={"IR": 2}, rows=5) as server:
+        with pytest.raises(SystemExit) as exit_info:
+            ipshin.main(
+                [
+                    "pipeline",
+                    "--country", "IR",
+                    "--report-url", server.report_url,
+                    "--api-url", server.api_url,
+                    "--cache-mode", "bypass",
+                    "--out", str(out),
+                    "--asn-out", str(asn_out),
+                    "--quiet",
+                ]
+            )
+    assert exit_info.value.code == 0
+    expected = sorted(page_asns("IR", 1, 5) + page_asns("IR", 2, 5))
+    assert asn_out.read_text().split() == [str(asn) for asn in expected]
+    assert out.read_text().strip()
+
+
+@pytest.mark.parametrize("option", ["--workers", "--page-workers", "--max-pages"])
+def test_counts_must_be_positive(option):
+    with pytest.raises(SystemExit) as exit_info:
+        ipshin.main(["pipeline", option, "0"])
+    assert exit_info.value.code == 2
+
+
+def test_value_errors_exit_with_an_error(monkeypatch, capsys):
+    def fail(args, out):
+        raise ValueError("bad input")
+
+    monkeypatch.setitem(ipshin.COMMANDS, "pipeline", fail)
+    with pytest.raises(SystemExit) as exit_info:
+        ipshin.main(["pipeline", "--quiet"])
+    assert exit_info.value.code == 1
+    assert "ipshin: bad input" in capsys.readouterr().err
@@ -0,0 +1,39 @@
+import struct
+
+import pytest
+
+from lookup import INDEX_MAGIC, INVALID, LookupIndex
+from prefixset import PrefixSet
+
+
+@pytest.fixture
+def index():
+    return LookupIndex.from_asn_map(
+        {"64500": PrefixSet(["10.0.0.0/8", "2001:db8::/32"]), "64501": PrefixSet(["192.0.2.0/24"])}
+    )
+
+
+def test_lookup_many_keeps_one_row_per_address(index):
+    rows = list(index.lookup_many(["10.1.2.3", "nope", "", "8.8.8.8", "2001:db8::1", "192.0.2.9"]))
+    assert [ip for ip, _ in rows] == ["10.1.2.3", "nope", "8.8.8.8", "2001:db8::1", "192.0.2.9"]
+    assert rows[1][1] is INVALID
+    assert rows[2][1] is None
+
+
+def test_index_round_trip(index, tmp_path):
+    path = str(tmp_path / "index.bin")
+    index.save(path)
+    loaded = LookupIndex.load(path)
+    addresses = ["10.1.2.3", "8.8.8.8", "2001:db8::1", "192.0.2.9"]
+    assert list(loaded.lookup_many(addresses)) == list(index.lookup_many(addresses))
+
+
+def test_only_current_index_format_loads(tmp_path):
+    old = tmp_path / "old.bin"
+    old.write_bytes(b"IPSHLKP1" + struct.pack("<I", 0))
+    with pytest.raises(ValueError, match="not an Ipshin lookup index"):
+        LookupIndex.load(str(old))
+    truncated = tmp_path / "truncated.bin"
+    truncated.write_bytes(INDEX_MAGIC + b"\x01")
+    with pytest.raises(EOFError):
+        LookupIndex.load(str(truncated))
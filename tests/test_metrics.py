@@ -0,0 +1,36 @@
+import pstats
+import threading
+
+import metrics
+
+
+def profiled_worker():
+    return sum(range(1000))
+
+
+def profiled_functions(path):
+    return {name for _, _, name in pstats.Stats(str(path)).stats}
+
+
+def test_thread_profiler_covers_worker_threads(tmp_path):
+    profiler = metrics.ThreadProfiler()
+    profiler.start()
+    thread = threading.Thread(target=profiled_worker)
+    thread.start()
+    thread.join()
+    profiler.stop(str(tmp_path / "run.prof"))
+    assert "profiled_worker" in profiled_functions(tmp_path / "run.prof")
+
+
+def test_thread_profiler_shared_mode(tmp_path, monkeypatch):
+    # The Python 3.12+ path: one profiler, no per-thread hook.
+    monkeypatch.setattr(metrics, "SHARED_PROFILER", True)
+    profiler = metrics.ThreadProfiler()
+    profiler.start()
+    profiled_worker()
+    thread = threading.Thread(target=profiled_worker)
+    thread.start()
+    thread.join()
+    profiler.stop(str(tmp_path / "run.prof"))
+    assert len(profiler._profiles) == 1
+    assert "profiled_worker" in profiled_functions(tmp_path / "run.prof")
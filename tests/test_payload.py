@@ -0,0 +1,62 @@
+import json
+import os
+import sys
+
+import pytest
+
+import ipfinder
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from fixtures import prefix_payload  # noqa: E402
+
+ITEM = {"prefix": "5.160.0.0/16", "parent": {"prefix": "5.0.0.0/8"}}
+PAYLOADS = [
+    '{"data": null}',
+    '{"data": []}',
+    '{"data": "none"}',
+    '{"data": 5}',
+    "[1, 2]",
+    '"data"',
+    "{}",
+    '{"status": "ok"}',
+    '{"data": {}}',
+    '{"data": {"ipv4_prefixes": null}}',
+    '{"data": {"ipv4_prefixes": {"prefix": "1.2.3.0/24"}}}',
+    json.dumps({"data": {"ipv4_prefixes": [ITEM, 5, {"prefix": "1.2.3.4/24"}]}}),
+    json.dumps({"meta": {"ipv4_prefixes": [ITEM]}, "data": {"ipv6_prefixes": [{"prefix": "2a01::/16"}]}}),
+    json.dumps({"data": {"name": "data", "ipv4_prefixes": [ITEM]}}),
+    prefix_payload(12880, ipv4=5, ipv6=2),
+]
+
+
+def json_path(text):
+    try:
+        return sorted(map(str, ipfinder.parse_prefix_payload(text)))
+    except ValueError:
+        return "ValueError"
+
+
+def streaming(chunks):
+    parser = ipfinder.PrefixPayloadParser()
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+        return sorted(map(str, parser.close()))
+    except ValueError:
+        return "ValueError"
+
+
+@pytest.mark.parametrize("text", PAYLOADS)
+def test_streaming_parser_matches_json_path(text):
+    assert len(text) < ipfinder.STREAM_MIN_CHARS
+    expected = json_path(text)
+    assert streaming([text]) == expected
+    # Bodies padded past STREAM_MIN_CHARS take the streaming path in parse_prefix_payload.
+    assert json_path(text + " " * ipfinder.STREAM_MIN_CHARS) == expected
+    for split in range(1, len(text)):
+        assert streaming([text[:split], text[split:]]) == expected, split
+
+
+def test_null_data_is_an_error():
+    assert json_path('{"data": null}') == "ValueError"
@@ -0,0 +1,28 @@
+import random
+
+from prefixset import PrefixSet
+
+
+def test_keys_merge_pending_into_sorted_keys():
+    rng = random.Random(1)
+    prefixes = PrefixSet()
+    expected = {4: set(), 6: set()}
+    for _ in range(20):
+        batch4 = [rng.randrange(1 << 12) for _ in range(rng.randrange(200))]
+        batch6 = [rng.randrange(1 << 12) for _ in range(rng.randrange(50))]
+        # Repeat some keys inside the batch and from earlier batches.
+        batch4 += batch4[: len(batch4) // 3]
+        prefixes.update_keys(batch4, 4)
+        prefixes.update_keys(batch6, 6)
+        expected[4].update(batch4)
+        expected[6].update(batch6)
+        assert list(prefixes.keys(4)) == sorted(expected[4])
+        assert prefixes.keys(6) == sorted(expected[6])
+    assert prefixes.keys(4).typecode == "Q"
+
+
+def test_keys_without_pending_are_unchanged():
+    prefixes = PrefixSet(["10.0.0.0/8", "10.0.0.0/8", "192.0.2.0/24", "2001:db8::/32"])
+    keys = prefixes.keys(4)
+    assert prefixes.keys(4) is keys
+    assert prefixes.to_text().splitlines() == ["10.0.0.0/8", "192.0.2.0/24", "2001:db8::/32"]
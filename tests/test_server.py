@@ -0,0 +1,96 @@
+import http.client
+import socket
+import threading
+
+import pytest
+
+import server
+from prefixset import PrefixSet
+
+SMUGGLED = b"GET /status HTTP/1.1\r\nHost: x\r\n\r\n"
+
+
+@pytest.fixture
+def service_url():
+    service = server.PrefixService(lambda: [])
+    prefixes = PrefixSet((10 << 24 | i << 8, 24) for i in range(0, 512, 2))
+    service.snapshot = server.Snapshot(1, {"64500": prefixes})
+    httpd = server.ServiceServer(("127.0.0.1", 0), service)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def raw_exchange(address, request):
+    """Sends raw bytes on one connection and returns everything read until it closes."""
+    with socket.create_connection(address, timeout=2) as sock:
+        sock.sendall(request)
+        received = b""
+        try:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                received += chunk
+        except socket.timeout:
+            pass
+    return received
+
+
+def post(path, body):
+    return (
+        f"POST {path} HTTP/1.1\r\nHost: x\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+
+
+def test_unread_post_body_is_not_parsed_as_a_request(service_url):
+    received = raw_exchange(service_url, post("/status", SMUGGLED))
+    assert received.startswith(b"HTTP/1.1 405")
+    assert b"Connection: close" in received
+    assert received.count(b"HTTP/1.1 ") == 1
+
+
+def test_oversized_lookup_body_closes_the_connection(service_url, monkeypatch):
+    monkeypatch.setattr(server, "MAX_LOOKUP_BODY", 8)
+    received = raw_exchange(service_url, post("/lookup", SMUGGLED))
+    assert received.startswith(b"HTTP/1.1 400")
+    assert received.count(b"HTTP/1.1 ") == 1
+
+
+def test_lookup_post_keeps_the_connection_alive(service_url):
+    connection = http.client.HTTPConnection(*service_url, timeout=2)
+    for _ in range(2):
+        connection.request("POST", "/lookup", body=b"10.0.0.1\n10.0.1.1\nnope\n")
+        response = connection.getresponse()
+        assert response.status == 200
+        assert response.getheader("Connection") != "close"
+        response.read()
+    connection.close()
+
+
+def test_gzip_and_identity_bodies_have_distinct_etags(service_url):
+    connection = http.client.HTTPConnection(*service_url, timeout=2)
+    tags = {}
+    for encoding in ("identity", "gzip"):
+        connection.request("GET", "/rules", headers={"Accept-Encoding": encoding})
+        response = connection.getresponse()
+        response.read()
+        tags[encoding] = response.getheader("ETag")
+        assert response.getheader("Content-Encoding") == (encoding if encoding == "gzip" else None)
+    assert tags["identity"] != tags["gzip"]
+
+    connection.request(
+        "GET", "/rules", headers={"Accept-Encoding": "gzip", "If-None-Match": tags["identity"]}
+    )
+    response = connection.getresponse()
+    response.read()
+    assert response.status == 200
+    connection.request(
+        "GET", "/rules", headers={"Accept-Encoding": "gzip", "If-None-Match": tags["gzip"]}
+    )
+    response = connection.getresponse()
+    response.read()
+    assert response.status == 304
+    connection.close()